@@ -1,14 +1,62 @@
 import logging
-from typing import List, Dict, Any
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
+from typing import List, Dict, Any, Optional
+import xlsxwriter
+from xlsxwriter.workbook import Workbook
+from xlsxwriter.format import Format
+from xlsxwriter.worksheet import Worksheet
 from datetime import datetime
-import json
+import orjson
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# Cell formats by role; each workbook registers them once with add_format
+FORMATS = {
+    'title': {'bold': True, 'font_size': 16},
+    'section': {'bold': True, 'font_size': 14},
+    'subsection': {'bold': True, 'font_size': 12},
+    'bold': {'bold': True},
+    'italic': {'italic': True},
+    'header': {'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#366092', 'pattern': 1},
+    'company_header': {'bold': True, 'font_size': 14, 'font_color': '#FFFFFF', 'bg_color': '#366092', 'pattern': 1},
+    'wrap': {'text_wrap': True},
+}
+
+class SheetWriter:
+    """
+    Appends rows top to bottom to an xlsxwriter worksheet.
+    
+    constant_memory mode flushes each row once a later row is started, so
+    rows must be written in order; this keeps the cursor for the sheet builders.
+    """
+    
+    def __init__(self, ws: Worksheet, widths: Dict[int, float]):
+        self.ws = ws
+        self.row = 0
+        for col, width in widths.items():
+            ws.set_column(col, col, width)
+    
+    def append(self, values=(), cell_format: Optional[Format] = None):
+        """Write a row of values, all in the same format."""
+        self.ws.write_row(self.row, 0, values, cell_format)
+        self.row += 1
+    
+    def append_pair(self, label, value, label_format: Optional[Format] = None,
+                    value_format: Optional[Format] = None):
+        """Write a label/value row."""
+        self.ws.write(self.row, 0, label, label_format)
+        self.ws.write(self.row, 1, value, value_format)
+        self.row += 1
+    
+    def append_merged(self, value, last_col: int, cell_format: Format):
+        """Write one value merged across columns 0..last_col."""
+        self.ws.merge_range(self.row, 0, self.row, last_col, value, cell_format)
+        self.row += 1
+    
+    def skip(self, rows: int = 1):
+        """Leave blank rows."""
+        self.row += rows
+
 class ExcelGenerator:
     """
     Service for generating Excel files from extracted data following ILPA templates.
@@ -16,6 +64,15 @@ class ExcelGenerator:
     
     def __init__(self):
         self.templates = self._load_templates()
+        
+        # Sheet type -> builder; unknown types fall back to the generic sheet
+        self._sheet_builders = {
+            'executive_summary': self._create_executive_summary,
+            'schedule_of_investments': self._create_schedule_of_investments,
+            'portfolio_companies': self._create_portfolio_companies,
+            'financial_statements': self._create_financial_statements,
+            'footnotes': self._create_footnotes,
+        }
     
     def _load_templates(self) -> Dict[str, Any]:
         """Load Excel templates configuration."""
@@ -24,9 +81,8 @@ class ExcelGenerator:
         
         for template_file in template_dir.glob("*.json"):
             try:
-                with open(template_file, 'r') as f:
-                    template_id = template_file.stem
-                    templates[template_id] = json.load(f)
+                template_id = template_file.stem
+                templates[template_id] = orjson.loads(template_file.read_bytes())
             except Exception as e:
                 logger.error(f"Error loading template {template_file}: {e}")
         
@@ -42,35 +98,26 @@ class ExcelGenerator:
         
         logger.info(f"Generating Excel file: {output_path}")
         
-        wb = Workbook()
-        
-        # Remove default sheet
-        if 'Sheet' in wb.sheetnames:
-            wb.remove(wb['Sheet'])
+        # constant_memory streams each finished row to disk, so sheets are
+        # built strictly top to bottom. URL-like strings stay plain text.
+        wb = xlsxwriter.Workbook(output_path, {
+            'constant_memory': True,
+            'use_zip64': True,
+            'strings_to_urls': False,
+        })
+        fmt = {role: wb.add_format(props) for role, props in FORMATS.items()}
         
         template = self.templates.get(template_id, {})
         sheets_config = template.get('excel_sheets', [])
         
         # Generate sheets based on template
         for sheet_config in sheets_config:
-            sheet_name = sheet_config.get('name', 'Data')
             sheet_type = sheet_config.get('type', 'summary')
-            
-            if sheet_type == 'executive_summary':
-                self._create_executive_summary(wb, extracted_data, sheet_config)
-            elif sheet_type == 'schedule_of_investments':
-                self._create_schedule_of_investments(wb, extracted_data, sheet_config)
-            elif sheet_type == 'portfolio_companies':
-                self._create_portfolio_companies(wb, extracted_data, sheet_config)
-            elif sheet_type == 'financial_statements':
-                self._create_financial_statements(wb, extracted_data, sheet_config)
-            elif sheet_type == 'footnotes':
-                self._create_footnotes(wb, extracted_data, sheet_config)
-            else:
-                self._create_generic_sheet(wb, extracted_data, sheet_config)
+            build = self._sheet_builders.get(sheet_type, self._create_generic_sheet)
+            build(wb, fmt, extracted_data, sheet_config)
         
         # Save workbook
-        wb.save(output_path)
+        wb.close()
         logger.info(f"Excel file generated successfully: {output_path}")
         
         return output_path
@@ -78,27 +125,24 @@ class ExcelGenerator:
     def _create_executive_summary(
         self,
         wb: Workbook,
+        fmt: Dict[str, Format],
         data: List[Dict[str, Any]],
         config: Dict[str, Any]
     ):
         """Create Executive Summary sheet."""
         
-        ws = wb.create_sheet(config.get('name', 'Executive Summary'))
+        sheet = SheetWriter(wb.add_worksheet(config.get('name', 'Executive Summary')), {0: 40, 1: 25})
         
         # Merge data from all files
         merged_data = self._merge_fund_data(data)
         
         # Header
-        ws['A1'] = 'Fund Executive Summary'
-        ws['A1'].font = Font(size=16, bold=True)
-        
-        row = 3
+        sheet.append(['Fund Executive Summary'], fmt['title'])
+        sheet.skip()
         
         # General Partner Info
-        ws[f'A{row}'] = 'General Partner:'
-        ws[f'A{row}'].font = Font(bold=True)
-        ws[f'B{row}'] = merged_data.get('general_partner', 'N/A')
-        row += 2
+        sheet.append_pair('General Partner:', merged_data.get('general_partner', 'N/A'), fmt['bold'])
+        sheet.skip()
         
         # Fund Details
         fund_fields = [
@@ -115,17 +159,12 @@ class ExcelGenerator:
         ]
         
         for label, field in fund_fields:
-            ws[f'A{row}'] = label
-            ws[f'A{row}'].font = Font(bold=True)
-            ws[f'B{row}'] = merged_data.get(field, 'N/A')
-            row += 1
+            sheet.append_pair(label, merged_data.get(field, 'N/A'), fmt['bold'])
         
-        row += 1
+        sheet.skip()
         
         # Financial Metrics
-        ws[f'A{row}'] = 'Key Financial Metrics'
-        ws[f'A{row}'].font = Font(size=14, bold=True)
-        row += 1
+        sheet.append(['Key Financial Metrics'], fmt['section'])
         
         metrics = [
             ('DPI (Distribution to Paid-in Capital)', 'dpi'),
@@ -136,25 +175,17 @@ class ExcelGenerator:
         ]
         
         for label, field in metrics:
-            ws[f'A{row}'] = label
-            ws[f'A{row}'].font = Font(bold=True)
-            ws[f'B{row}'] = merged_data.get(field, 'N/A')
-            row += 1
-        
-        # Auto-adjust column width
-        ws.column_dimensions['A'].width = 40
-        ws.column_dimensions['B'].width = 25
+            sheet.append_pair(label, merged_data.get(field, 'N/A'), fmt['bold'])
     
     def _create_schedule_of_investments(
         self,
         wb: Workbook,
+        fmt: Dict[str, Format],
         data: List[Dict[str, Any]],
         config: Dict[str, Any]
     ):
         """Create Schedule of Investments sheet."""
         
-        ws = wb.create_sheet(config.get('name', 'Schedule of Investments'))
-        
         # Headers
         headers = [
             'Company Name',
@@ -170,59 +201,50 @@ class ExcelGenerator:
             'Multiple of Invested Capital',
             'Gross IRR'
         ]
-        
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-            cell.font = Font(color="FFFFFF", bold=True)
+        fields = (
+            'company_name',
+            'security_type',
+            'number_of_shares',
+            'fund_ownership_percent',
+            'initial_investment_date',
+            'fund_commitment',
+            'total_invested',
+            'current_cost',
+            'reported_value',
+            'realized_proceeds',
+            'multiple_of_invested_capital',
+            'gross_irr',
+        )
+        
+        sheet = SheetWriter(wb.add_worksheet(config.get('name', 'Schedule of Investments')),
+                            {col: 18 for col in range(len(headers))})
+        sheet.append(headers, fmt['header'])
         
         # Data rows
-        row = 2
         for file_data in data:
             investments = file_data.get('data', {}).get('investments', [])
             
             for investment in investments:
-                ws.cell(row=row, column=1, value=investment.get('company_name', ''))
-                ws.cell(row=row, column=2, value=investment.get('security_type', ''))
-                ws.cell(row=row, column=3, value=investment.get('number_of_shares', ''))
-                ws.cell(row=row, column=4, value=investment.get('fund_ownership_percent', ''))
-                ws.cell(row=row, column=5, value=investment.get('initial_investment_date', ''))
-                ws.cell(row=row, column=6, value=investment.get('fund_commitment', ''))
-                ws.cell(row=row, column=7, value=investment.get('total_invested', ''))
-                ws.cell(row=row, column=8, value=investment.get('current_cost', ''))
-                ws.cell(row=row, column=9, value=investment.get('reported_value', ''))
-                ws.cell(row=row, column=10, value=investment.get('realized_proceeds', ''))
-                ws.cell(row=row, column=11, value=investment.get('multiple_of_invested_capital', ''))
-                ws.cell(row=row, column=12, value=investment.get('gross_irr', ''))
-                row += 1
-        
-        # Format columns
-        for col in range(1, 13):
-            ws.column_dimensions[get_column_letter(col)].width = 18
+                sheet.append(tuple(investment.get(field, '') for field in fields))
     
     def _create_portfolio_companies(
         self,
         wb: Workbook,
+        fmt: Dict[str, Format],
         data: List[Dict[str, Any]],
         config: Dict[str, Any]
     ):
         """Create Portfolio Companies sheet with detailed company information."""
         
-        ws = wb.create_sheet(config.get('name', 'Portfolio Companies'))
-        
-        row = 1
+        sheet = SheetWriter(wb.add_worksheet(config.get('name', 'Portfolio Companies')),
+                            {0: 30, 1: 30, 2: 20, 3: 20})
         
         for file_data in data:
             companies = file_data.get('data', {}).get('portfolio_companies', [])
             
             for company in companies:
                 # Company header
-                ws[f'A{row}'] = company.get('company_name', 'Unknown Company')
-                ws[f'A{row}'].font = Font(size=14, bold=True, color="FFFFFF")
-                ws[f'A{row}'].fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-                ws.merge_cells(f'A{row}:D{row}')
-                row += 1
+                sheet.append_merged(company.get('company_name', 'Unknown Company'), 3, fmt['company_header'])
                 
                 # Company details
                 company_fields = [
@@ -244,73 +266,31 @@ class ExcelGenerator:
                 ]
                 
                 for label, field in company_fields:
-                    ws[f'A{row}'] = label
-                    ws[f'A{row}'].font = Font(bold=True)
-                    ws[f'B{row}'] = company.get(field, 'N/A')
-                    row += 1
-                
-                # Company description
-                if 'company_description' in company:
-                    ws[f'A{row}'] = 'Company Description'
-                    ws[f'A{row}'].font = Font(bold=True)
-                    row += 1
-                    ws[f'A{row}'] = company.get('company_description', '')
-                    ws[f'A{row}'].alignment = Alignment(wrap_text=True)
-                    ws.merge_cells(f'A{row}:D{row}')
-                    row += 1
+                    sheet.append_pair(label, company.get(field, 'N/A'), fmt['bold'])
                 
-                # Investment thesis
-                if 'investment_thesis' in company:
-                    ws[f'A{row}'] = 'Investment Thesis'
-                    ws[f'A{row}'].font = Font(bold=True)
-                    row += 1
-                    ws[f'A{row}'] = company.get('investment_thesis', '')
-                    ws[f'A{row}'].alignment = Alignment(wrap_text=True)
-                    ws.merge_cells(f'A{row}:D{row}')
-                    row += 1
+                # Company description and investment thesis
+                for title, field in (('Company Description', 'company_description'),
+                                     ('Investment Thesis', 'investment_thesis')):
+                    if field in company:
+                        sheet.append([title], fmt['bold'])
+                        sheet.append_merged(company.get(field, ''), 3, fmt['wrap'])
                 
                 # Historical performance
                 if 'historical_performance' in company:
-                    ws[f'A{row}'] = 'Historical Performance'
-                    ws[f'A{row}'].font = Font(bold=True, size=12)
-                    row += 1
+                    sheet.append(['Historical Performance'], fmt['subsection'])
                     
                     perf_data = company.get('historical_performance', {})
                     years = perf_data.get('years', [])
                     
                     if years:
-                        # Headers
-                        ws[f'A{row}'] = 'Metric'
-                        for i, year in enumerate(years, 2):
-                            ws.cell(row=row, column=i, value=year)
-                        row += 1
-                        
-                        # Revenue
-                        ws[f'A{row}'] = 'Revenue'
-                        revenues = perf_data.get('revenue', [])
-                        for i, rev in enumerate(revenues, 2):
-                            ws.cell(row=row, column=i, value=rev)
-                        row += 1
-                        
-                        # EBITDA
-                        ws[f'A{row}'] = 'EBITDA'
-                        ebitdas = perf_data.get('ebitda', [])
-                        for i, ebitda in enumerate(ebitdas, 2):
-                            ws.cell(row=row, column=i, value=ebitda)
-                        row += 1
-                        
-                        # EBITDA Margin
-                        ws[f'A{row}'] = 'EBITDA Margin %'
-                        margins = perf_data.get('ebitda_margin', [])
-                        for i, margin in enumerate(margins, 2):
-                            ws.cell(row=row, column=i, value=margin)
-                        row += 1
+                        sheet.append(['Metric', *years])
+                        sheet.append(['Revenue', *perf_data.get('revenue', [])])
+                        sheet.append(['EBITDA', *perf_data.get('ebitda', [])])
+                        sheet.append(['EBITDA Margin %', *perf_data.get('ebitda_margin', [])])
                 
                 # Recent performance
                 if 'recent_performance' in company:
-                    ws[f'A{row}'] = 'Recent Performance'
-                    ws[f'A{row}'].font = Font(bold=True, size=12)
-                    row += 1
+                    sheet.append(['Recent Performance'], fmt['subsection'])
                     
                     recent = company.get('recent_performance', {})
                     
@@ -324,57 +304,57 @@ class ExcelGenerator:
                     ]
                     
                     for label, field in recent_fields:
-                        ws[f'A{row}'] = label
-                        ws[f'B{row}'] = recent.get(field, 'N/A')
-                        row += 1
+                        sheet.append_pair(label, recent.get(field, 'N/A'))
                 
-                row += 2  # Space between companies
-        
-        # Format columns
-        ws.column_dimensions['A'].width = 30
-        ws.column_dimensions['B'].width = 30
-        ws.column_dimensions['C'].width = 20
-        ws.column_dimensions['D'].width = 20
+                sheet.skip(2)  # Space between companies
     
     def _create_financial_statements(
         self,
         wb: Workbook,
+        fmt: Dict[str, Format],
         data: List[Dict[str, Any]],
         config: Dict[str, Any]
     ):
         """Create Financial Statements sheets."""
         
         # Income Statement
-        ws_income = wb.create_sheet('Statement of Operations')
-        self._populate_income_statement(ws_income, data)
+        ws_income = SheetWriter(wb.add_worksheet('Statement of Operations'), {0: 40, 1: 20})
+        self._populate_income_statement(ws_income, fmt, data)
         
         # Balance Sheet
-        ws_balance = wb.create_sheet('Balance Sheet')
-        self._populate_balance_sheet(ws_balance, data)
+        ws_balance = SheetWriter(wb.add_worksheet('Balance Sheet'), {0: 40, 1: 20})
+        self._populate_balance_sheet(ws_balance, fmt, data)
         
         # Cash Flow
-        ws_cashflow = wb.create_sheet('Statement of Cash Flows')
-        self._populate_cashflow_statement(ws_cashflow, data)
+        ws_cashflow = SheetWriter(wb.add_worksheet('Statement of Cash Flows'), {0: 40})
+        self._populate_cashflow_statement(ws_cashflow, fmt, data)
         
         # Partners Capital
-        ws_pcap = wb.create_sheet('Partners Capital Statement')
-        self._populate_pcap_statement(ws_pcap, data)
+        ws_pcap = SheetWriter(wb.add_worksheet('Partners Capital Statement'), {0: 40, 1: 20})
+        self._populate_pcap_statement(ws_pcap, fmt, data)
     
-    def _populate_income_statement(self, ws, data):
+    def _append_items(self, sheet: SheetWriter, values: Dict[str, Any], items) -> float:
+        """Label/value rows (missing values default to 0); returns the numeric sum."""
+        
+        total = 0
+        for label, field in items:
+            value = values.get(field, 0)
+            sheet.append_pair(label, value)
+            if isinstance(value, (int, float)):
+                total += value
+        return total
+    
+    def _populate_income_statement(self, sheet: SheetWriter, fmt: Dict[str, Format], data):
         """Populate income statement data."""
         
         merged_data = self._merge_fund_data(data)
         income_stmt = merged_data.get('income_statement', {})
         
-        ws['A1'] = 'Statement of Operations'
-        ws['A1'].font = Font(size=14, bold=True)
-        
-        row = 3
+        sheet.append(['Statement of Operations'], fmt['section'])
+        sheet.skip()
         
         # Income section
-        ws[f'A{row}'] = 'Income'
-        ws[f'A{row}'].font = Font(bold=True)
-        row += 1
+        sheet.append(['Income'], fmt['bold'])
         
         income_items = [
             ('Dividend Income', 'dividend_income'),
@@ -382,25 +362,12 @@ class ExcelGenerator:
             ('Other Income', 'other_income'),
         ]
         
-        total_income = 0
-        for label, field in income_items:
-            value = income_stmt.get(field, 0)
-            ws[f'A{row}'] = label
-            ws[f'B{row}'] = value
-            if isinstance(value, (int, float)):
-                total_income += value
-            row += 1
-        
-        ws[f'A{row}'] = 'Total Income'
-        ws[f'A{row}'].font = Font(bold=True)
-        ws[f'B{row}'] = total_income
-        ws[f'B{row}'].font = Font(bold=True)
-        row += 2
+        total_income = self._append_items(sheet, income_stmt, income_items)
+        sheet.append_pair('Total Income', total_income, fmt['bold'], fmt['bold'])
+        sheet.skip()
         
         # Expenses section
-        ws[f'A{row}'] = 'Expenses'
-        ws[f'A{row}'].font = Font(bold=True)
-        row += 1
+        sheet.append(['Expenses'], fmt['bold'])
         
         expense_items = [
             ('Management Fees', 'management_fees'),
@@ -408,52 +375,28 @@ class ExcelGenerator:
             ('Other Expenses', 'other_expenses'),
         ]
         
-        total_expenses = 0
-        for label, field in expense_items:
-            value = income_stmt.get(field, 0)
-            ws[f'A{row}'] = label
-            ws[f'B{row}'] = value
-            if isinstance(value, (int, float)):
-                total_expenses += value
-            row += 1
-        
-        ws[f'A{row}'] = 'Total Expenses'
-        ws[f'A{row}'].font = Font(bold=True)
-        ws[f'B{row}'] = total_expenses
-        ws[f'B{row}'].font = Font(bold=True)
-        row += 2
+        total_expenses = self._append_items(sheet, income_stmt, expense_items)
+        sheet.append_pair('Total Expenses', total_expenses, fmt['bold'], fmt['bold'])
+        sheet.skip()
         
         # Net unrealized gain
-        ws[f'A{row}'] = 'Net Unrealized Gain on Investments'
-        ws[f'B{row}'] = income_stmt.get('net_unrealized_gain', 0)
-        row += 1
+        sheet.append_pair('Net Unrealized Gain on Investments', income_stmt.get('net_unrealized_gain', 0))
         
         # Total comprehensive income
         comprehensive_income = total_income - total_expenses + income_stmt.get('net_unrealized_gain', 0)
-        ws[f'A{row}'] = 'Total Comprehensive Income'
-        ws[f'A{row}'].font = Font(bold=True, size=12)
-        ws[f'B{row}'] = comprehensive_income
-        ws[f'B{row}'].font = Font(bold=True)
-        
-        # Format
-        ws.column_dimensions['A'].width = 40
-        ws.column_dimensions['B'].width = 20
+        sheet.append_pair('Total Comprehensive Income', comprehensive_income, fmt['subsection'], fmt['bold'])
     
-    def _populate_balance_sheet(self, ws, data):
+    def _populate_balance_sheet(self, sheet: SheetWriter, fmt: Dict[str, Format], data):
         """Populate balance sheet data."""
         
         merged_data = self._merge_fund_data(data)
         balance_sheet = merged_data.get('balance_sheet', {})
         
-        ws['A1'] = 'Balance Sheet'
-        ws['A1'].font = Font(size=14, bold=True)
-        
-        row = 3
+        sheet.append(['Balance Sheet'], fmt['section'])
+        sheet.skip()
         
         # Assets
-        ws[f'A{row}'] = 'ASSETS'
-        ws[f'A{row}'].font = Font(bold=True, size=12)
-        row += 1
+        sheet.append(['ASSETS'], fmt['subsection'])
         
         asset_items = [
             ('Investments at Fair Value', 'investments_fair_value'),
@@ -462,74 +405,40 @@ class ExcelGenerator:
             ('Other Assets', 'other_assets'),
         ]
         
-        total_assets = 0
-        for label, field in asset_items:
-            value = balance_sheet.get(field, 0)
-            ws[f'A{row}'] = label
-            ws[f'B{row}'] = value
-            if isinstance(value, (int, float)):
-                total_assets += value
-            row += 1
-        
-        ws[f'A{row}'] = 'Total Assets'
-        ws[f'A{row}'].font = Font(bold=True)
-        ws[f'B{row}'] = total_assets
-        ws[f'B{row}'].font = Font(bold=True)
-        row += 2
+        total_assets = self._append_items(sheet, balance_sheet, asset_items)
+        sheet.append_pair('Total Assets', total_assets, fmt['bold'], fmt['bold'])
+        sheet.skip()
         
         # Liabilities
-        ws[f'A{row}'] = 'LIABILITIES'
-        ws[f'A{row}'].font = Font(bold=True, size=12)
-        row += 1
+        sheet.append(['LIABILITIES'], fmt['subsection'])
         
         liability_items = [
             ('Amount Due to Related Party', 'due_to_related_party'),
             ('Other Payables', 'other_payables'),
         ]
         
-        total_liabilities = 0
-        for label, field in liability_items:
-            value = balance_sheet.get(field, 0)
-            ws[f'A{row}'] = label
-            ws[f'B{row}'] = value
-            if isinstance(value, (int, float)):
-                total_liabilities += value
-            row += 1
-        
-        ws[f'A{row}'] = 'Total Liabilities'
-        ws[f'A{row}'].font = Font(bold=True)
-        ws[f'B{row}'] = total_liabilities
-        ws[f'B{row}'].font = Font(bold=True)
-        row += 2
+        total_liabilities = self._append_items(sheet, balance_sheet, liability_items)
+        sheet.append_pair('Total Liabilities', total_liabilities, fmt['bold'], fmt['bold'])
+        sheet.skip()
         
         # Partners Capital
-        ws[f'A{row}'] = "Partners' Capital"
-        ws[f'B{row}'] = total_assets - total_liabilities
-        ws[f'A{row}'].font = Font(bold=True, size=12)
-        ws[f'B{row}'].font = Font(bold=True)
-        
-        ws.column_dimensions['A'].width = 40
-        ws.column_dimensions['B'].width = 20
+        sheet.append_pair("Partners' Capital", total_assets - total_liabilities, fmt['subsection'], fmt['bold'])
     
-    def _populate_cashflow_statement(self, ws, data):
+    def _populate_cashflow_statement(self, sheet: SheetWriter, fmt: Dict[str, Format], data):
         """Populate cash flow statement."""
         
-        ws['A1'] = 'Statement of Cash Flows'
-        ws['A1'].font = Font(size=14, bold=True)
-        ws['A3'] = 'Cash flow data extracted from financial statements'
-        
-        ws.column_dimensions['A'].width = 40
+        sheet.append(['Statement of Cash Flows'], fmt['section'])
+        sheet.skip()
+        sheet.append(['Cash flow data extracted from financial statements'])
     
-    def _populate_pcap_statement(self, ws, data):
+    def _populate_pcap_statement(self, sheet: SheetWriter, fmt: Dict[str, Format], data):
         """Populate partners capital account statement."""
         
         merged_data = self._merge_fund_data(data)
         pcap = merged_data.get('partners_capital', {})
         
-        ws['A1'] = "Partners' Capital Account Statement"
-        ws['A1'].font = Font(size=14, bold=True)
-        
-        row = 3
+        sheet.append(["Partners' Capital Account Statement"], fmt['section'])
+        sheet.skip()
         
         pcap_items = [
             ('Total Commitments', 'total_commitments'),
@@ -539,78 +448,55 @@ class ExcelGenerator:
         ]
         
         for label, field in pcap_items:
-            ws[f'A{row}'] = label
-            ws[f'A{row}'].font = Font(bold=True)
-            ws[f'B{row}'] = pcap.get(field, 'N/A')
-            row += 1
-        
-        ws.column_dimensions['A'].width = 40
-        ws.column_dimensions['B'].width = 20
+            sheet.append_pair(label, pcap.get(field, 'N/A'), fmt['bold'])
     
     def _create_footnotes(
         self,
         wb: Workbook,
+        fmt: Dict[str, Format],
         data: List[Dict[str, Any]],
         config: Dict[str, Any]
     ):
         """Create footnotes sheet."""
         
-        ws = wb.create_sheet(config.get('name', 'Footnotes'))
+        sheet = SheetWriter(wb.add_worksheet(config.get('name', 'Footnotes')), {0: 80})
         
-        ws['A1'] = 'Footnotes and Disclosures'
-        ws['A1'].font = Font(size=14, bold=True)
-        
-        row = 3
+        sheet.append(['Footnotes and Disclosures'], fmt['section'])
+        sheet.skip()
         
         merged_data = self._merge_fund_data(data)
         footnotes = merged_data.get('footnotes', [])
         
         for idx, footnote in enumerate(footnotes, 1):
-            ws[f'A{row}'] = f"Note {idx}"
-            ws[f'A{row}'].font = Font(bold=True)
-            row += 1
-            
-            ws[f'A{row}'] = footnote.get('title', '')
-            ws[f'A{row}'].font = Font(italic=True)
-            row += 1
-            
-            ws[f'A{row}'] = footnote.get('content', '')
-            ws[f'A{row}'].alignment = Alignment(wrap_text=True)
-            row += 2
-        
-        ws.column_dimensions['A'].width = 80
+            sheet.append([f"Note {idx}"], fmt['bold'])
+            sheet.append([footnote.get('title', '')], fmt['italic'])
+            sheet.append([footnote.get('content', '')], fmt['wrap'])
+            sheet.skip()
     
     def _create_generic_sheet(
         self,
         wb: Workbook,
+        fmt: Dict[str, Format],
         data: List[Dict[str, Any]],
         config: Dict[str, Any]
     ):
         """Create a generic data sheet."""
         
-        ws = wb.create_sheet(config.get('name', 'Data'))
+        sheet = SheetWriter(wb.add_worksheet(config.get('name', 'Data')), {0: 30, 1: 50})
         
-        ws['A1'] = config.get('title', 'Extracted Data')
-        ws['A1'].font = Font(size=14, bold=True)
+        sheet.append([config.get('title', 'Extracted Data')], fmt['section'])
+        sheet.skip()
         
         # Simple key-value layout
-        row = 3
         for file_data in data:
-            ws[f'A{row}'] = 'Source File'
-            ws[f'A{row}'].font = Font(bold=True)
-            ws[f'B{row}'] = file_data.get('filename', '')
-            row += 2
+            sheet.append_pair('Source File', file_data.get('filename', ''), fmt['bold'])
+            sheet.skip()
             
             extracted = file_data.get('data', {})
             for key, value in extracted.items():
-                ws[f'A{row}'] = key
-                ws[f'B{row}'] = str(value)
-                row += 1
+                sheet.append_pair(key, str(value))
             
-            row += 2
-        
-        ws.column_dimensions['A'].width = 30
-        ws.column_dimensions['B'].width = 50
+            sheet.skip(2)
     
     def _merge_fund_data(self, data: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Merge data from multiple PDF files into a single fund view."""
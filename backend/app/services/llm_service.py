@@ -1,21 +1,49 @@
 import os
 import json
+import orjson
 import logging
-from typing import Dict, Any, Optional
-from mistralai.client import MistralClient
+from typing import Dict, Any, List, Optional, Tuple
+import httpx
+from mistralai.async_client import MistralAsyncClient
 from mistralai.models.chat_completion import ChatMessage
-from groq import Groq
+from groq import AsyncGroq
 import asyncio
+import random
+import re
+import time
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# Markdown fence lines, for responses that wrap JSON in prose
+_FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$', re.MULTILINE)
+
+def _strip_code_fences(content: str) -> str:
+    """Peel a leading ```json / ``` and trailing ``` with plain string ops."""
+    return content.strip().removeprefix('```json').removeprefix('```').removesuffix('```').strip()
+
+# Consecutive Mistral 429s before the breaker opens, and how long it stays open (seconds)
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 30.0
+
+def _backoff_delay(attempt: int, base: float = 1.0) -> float:
+    """Exponential backoff with jitter, so concurrent retries don't all fire at once."""
+    return min(60.0, base * 2 ** attempt + random.uniform(0, base))
+
+def _is_rate_limited(exc: Exception) -> bool:
+    """True for provider 429s (Mistral sets http_status, Groq sets status_code)."""
+    return 429 in (getattr(exc, "http_status", None), getattr(exc, "status_code", None))
+
 class LLMService:
     """
     Service for handling LLM-based data extraction with fallback mechanisms.
+
+    The provider clients hold pooled connections: use the service as an async
+    context manager (``async with LLMService() as llm: ...``) or call ``aclose()``
+    when done with it.
     """
     
-    def _init_(self):
+    def __init__(self):
         self.mistral_api_key = os.getenv("MISTRAL_API_KEY")
         self.groq_api_key = os.getenv("GROQ_API_KEY")
         
@@ -23,23 +51,56 @@ class LLMService:
         self.mistral_client = None
         self.groq_client = None
         
+        # Size both connection pools to the concurrency bound so bursts reuse keep-alive connections
+        llm_concurrency = int(os.getenv("LLM_CONCURRENCY", "8"))
+        
         if self.mistral_api_key:
             try:
-                self.mistral_client = MistralClient(api_key=self.mistral_api_key)
+                self.mistral_client = MistralAsyncClient(
+                    api_key=self.mistral_api_key,
+                    max_concurrent_requests=llm_concurrency
+                )
                 logger.info("Mistral client initialized successfully")
             except Exception as e:
                 logger.warning(f"Failed to initialize Mistral client: {e}")
         
         if self.groq_api_key:
             try:
-                self.groq_client = Groq(api_key=self.groq_api_key)
+                self.groq_client = AsyncGroq(
+                    api_key=self.groq_api_key,
+                    http_client=httpx.AsyncClient(
+                        limits=httpx.Limits(
+                            max_connections=llm_concurrency,
+                            max_keepalive_connections=llm_concurrency
+                        )
+                    )
+                )
                 logger.info("Groq client initialized successfully")
             except Exception as e:
                 logger.warning(f"Failed to initialize Groq client: {e}")
         
+        # Bound concurrent extractions so batch uploads respect provider rate limits
+        self._sem = asyncio.Semaphore(llm_concurrency)
+        
+        # Mistral circuit breaker: while open, extractions go straight to Groq
+        self._breaker = {"fails": 0, "open_until": 0.0}
+        
         # Load templates
         self.templates = self._load_templates()
     
+    async def aclose(self) -> None:
+        """Close the provider HTTP clients; call once on application shutdown."""
+        if self.mistral_client:
+            await self.mistral_client.close()
+        if self.groq_client:
+            await self.groq_client.close()
+    
+    async def __aenter__(self) -> "LLMService":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
+    
     def _load_templates(self) -> Dict[str, Any]:
         """Load extraction templates from JSON files."""
         templates = {}
@@ -47,10 +108,9 @@ class LLMService:
         
         for template_file in template_dir.glob("*.json"):
             try:
-                with open(template_file, 'r') as f:
-                    template_id = template_file.stem
-                    templates[template_id] = json.load(f)
-                    logger.info(f"Loaded template: {template_id}")
+                template_id = template_file.stem
+                templates[template_id] = orjson.loads(template_file.read_bytes())
+                logger.info(f"Loaded template: {template_id}")
             except Exception as e:
                 logger.error(f"Error loading template {template_file}: {e}")
         
@@ -104,6 +164,10 @@ Extract the data and return ONLY a valid JSON object matching the template schem
             logger.warning("Mistral client not available")
             return None
         
+        if time.monotonic() < self._breaker["open_until"]:
+            logger.info("Mistral circuit open, skipping to fallback")
+            return None
+        
         for attempt in range(max_retries):
             try:
                 logger.info(f"Attempting Mistral extraction (attempt {attempt + 1})")
@@ -112,11 +176,13 @@ Extract the data and return ONLY a valid JSON object matching the template schem
                     ChatMessage(role="user", content=prompt)
                 ]
                 
-                response = self.mistral_client.chat(
+                response = await self.mistral_client.chat(
                     model="mistral-large-latest",
                     messages=messages,
                     temperature=0.1,
-                    max_tokens=4000
+                    max_tokens=4000,
+                    # JSON mode: the reply is a bare object, so parsing rarely needs the fence fallbacks
+                    response_format={"type": "json_object"}
                 )
                 
                 content = response.choices[0].message.content
@@ -126,12 +192,19 @@ Extract the data and return ONLY a valid JSON object matching the template schem
                 
                 if data:
                     logger.info("Mistral extraction successful")
+                    self._breaker["fails"] = 0
                     return data
                 
             except Exception as e:
                 logger.warning(f"Mistral extraction attempt {attempt + 1} failed: {e}")
+                if _is_rate_limited(e):
+                    self._breaker["fails"] += 1
+                    if self._breaker["fails"] >= BREAKER_THRESHOLD:
+                        self._breaker["open_until"] = time.monotonic() + BREAKER_COOLDOWN
+                        logger.warning(f"Mistral rate limited {self._breaker['fails']} times, opening circuit for {BREAKER_COOLDOWN:.0f}s")
+                        return None
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
+                    await asyncio.sleep(_backoff_delay(attempt))
         
         return None
     
@@ -150,7 +223,7 @@ Extract the data and return ONLY a valid JSON object matching the template schem
             try:
                 logger.info(f"Attempting Groq extraction (attempt {attempt + 1})")
                 
-                response = self.groq_client.chat.completions.create(
+                response = await self.groq_client.chat.completions.create(
                     model="mixtral-8x7b-32768",
                     messages=[
                         {
@@ -174,30 +247,25 @@ Extract the data and return ONLY a valid JSON object matching the template schem
             except Exception as e:
                 logger.warning(f"Groq extraction attempt {attempt + 1} failed: {e}")
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(2 ** attempt)
+                    await asyncio.sleep(_backoff_delay(attempt))
         
         return None
     
     def _parse_json_response(self, content: str) -> Optional[Dict[str, Any]]:
         """Parse JSON from LLM response, handling markdown code blocks."""
         
+        # Common case: the whole response is (optionally) one fenced block
+        content = _strip_code_fences(content)
+        
         try:
-            # Remove markdown code blocks if present
-            content = content.strip()
-            if content.startswith("json"):
-                content = content[7:]
-            if content.startswith(""):
-                content = content[3:]
-            if content.endswith("```"):
-                content = content[:-3]
-            
-            content = content.strip()
-            
-            # Parse JSON
-            data = json.loads(content)
-            return data
-            
-        except json.JSONDecodeError as e:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError as e:
+            # Fences with prose around them: drop every fence line and retry
+            if '```' in content:
+                try:
+                    return orjson.loads(_FENCE_RE.sub('', content))
+                except orjson.JSONDecodeError:
+                    pass
             logger.error(f"JSON parsing error: {e}")
             logger.debug(f"Content: {content[:500]}")
             return None
@@ -232,6 +300,34 @@ Extract the data and return ONLY a valid JSON object matching the template schem
         
         return data
     
+    async def extract_many(
+        self,
+        jobs: List[Tuple[str, str, str]]
+    ) -> List[Any]:
+        """
+        Extract several documents concurrently.
+        
+        Each job is (text, template_id, filename). Results come back in job
+        order; a failed job yields its exception instead of a dict.
+        """
+        
+        async def run(text: str, template_id: str, filename: str) -> Dict[str, Any]:
+            async with self._sem:
+                return await self.extract_data(text, template_id, filename)
+        
+        # Shortest documents first: the semaphore admits waiters in FIFO order,
+        # so small jobs aren't stuck behind long ones when slots are scarce
+        order = sorted(range(len(jobs)), key=lambda i: len(jobs[i][0]))
+        results = await asyncio.gather(
+            *(run(*jobs[i]) for i in order),
+            return_exceptions=True
+        )
+        
+        in_job_order: List[Any] = [None] * len(jobs)
+        for i, result in zip(order, results):
+            in_job_order[i] = result
+        return in_job_order
+    
     def _validate_and_clean(
         self,
         data: Dict[str, Any],
@@ -261,7 +357,7 @@ Extract the data and return ONLY a valid JSON object matching the template schem
         if self.mistral_client:
             try:
                 # Simple test call
-                response = self.mistral_client.chat(
+                response = await self.mistral_client.chat(
                     model="mistral-large-latest",
                     messages=[ChatMessage(role="user", content="test")],
                     max_tokens=10
@@ -272,7 +368,7 @@ Extract the data and return ONLY a valid JSON object matching the template schem
         
         if self.groq_client:
             try:
-                response = self.groq_client.chat.completions.create(
+                response = await self.groq_client.chat.completions.create(
                     model="mixtral-8x7b-32768",
                     messages=[{"role": "user", "content": "test"}],
                     max_tokens=10
@@ -1,3 +1,4 @@
+import io
 import logging
 from typing import Optional, List, Dict
 import pdfplumber
@@ -9,6 +10,8 @@ import re
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_SPACE_RUN_RE = re.compile(r' +')
+
 class PDFExtractor:
     """
     Service for extracting text from PDF files with multiple fallback strategies.
@@ -27,13 +30,16 @@ class PDFExtractor:
 
         logger.info(f"Extracting text from: {pdf_path}")
 
-        # Try pdfplumber first
-        text = self._extract_with_pdfplumber(pdf_path)
+        # Read once; both parsers work from in-memory buffers
+        raw = path.read_bytes()
 
-        # Fallback to PyPDF2
-        if not text or len(text.strip()) < 50:
+        # Try pdfplumber first (blank pages are filled in from PyPDF2)
+        text = self._extract_with_pdfplumber(raw)
+
+        # Fallback to PyPDF2 if pdfplumber could not parse the file at all
+        if text is None:
             logger.info("Falling back to PyPDF2 extraction")
-            text = self._extract_with_pypdf2(pdf_path)
+            text = self._extract_with_pypdf2(raw)
 
         if not text or len(text.strip()) < 50:
             raise ValueError("Could not extract sufficient text from PDF")
@@ -42,13 +48,21 @@ class PDFExtractor:
         logger.info(f"Extracted {len(text)} characters from PDF")
         return text
 
-    def _extract_with_pdfplumber(self, pdf_path: str) -> Optional[str]:
+    def _extract_with_pdfplumber(self, raw: bytes) -> Optional[str]:
         try:
             text_parts = []
-            with pdfplumber.open(pdf_path) as pdf:
+            fallback_reader = None
+            with pdfplumber.open(io.BytesIO(raw)) as pdf:
                 for page_num, page in enumerate(pdf.pages, 1):
                     try:
                         page_text = page.extract_text()
+                        if (not page_text or not page_text.strip()) and page.chars:
+                            # Text layer present but pdfplumber got nothing: try PyPDF2 on
+                            # this page. Image-only (scanned) pages have no chars, so PyPDF2
+                            # would find nothing either and is never opened for them.
+                            if fallback_reader is None:
+                                fallback_reader = PyPDF2.PdfReader(io.BytesIO(raw))
+                            page_text = self._pypdf2_page_text(fallback_reader, page_num)
                         if page_text:
                             text_parts.append(f"\n--- Page {page_num} ---\n")
                             text_parts.append(page_text)
@@ -60,30 +74,39 @@ class PDFExtractor:
                     except Exception as e:
                         logger.warning(f"Error extracting page {page_num}: {e}")
                         continue
+                    finally:
+                        # Release parsed layout objects; pdf.pages keeps every page alive
+                        page.flush_cache()
             return "\n".join(text_parts)
         except Exception as e:
             logger.error(f"pdfplumber extraction failed: {e}")
             return None
 
-    def _extract_with_pypdf2(self, pdf_path: str) -> Optional[str]:
+    def _extract_with_pypdf2(self, raw: bytes) -> Optional[str]:
         try:
             text_parts = []
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page_num, page in enumerate(pdf_reader.pages, 1):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text_parts.append(f"\n--- Page {page_num} ---\n")
-                            text_parts.append(page_text)
-                    except Exception as e:
-                        logger.warning(f"Error extracting page {page_num}: {e}")
-                        continue
+            pdf_reader = PyPDF2.PdfReader(io.BytesIO(raw))
+            for page_num, page in enumerate(pdf_reader.pages, 1):
+                try:
+                    page_text = page.extract_text()
+                    if page_text:
+                        text_parts.append(f"\n--- Page {page_num} ---\n")
+                        text_parts.append(page_text)
+                except Exception as e:
+                    logger.warning(f"Error extracting page {page_num}: {e}")
+                    continue
             return "\n".join(text_parts)
         except Exception as e:
             logger.error(f"PyPDF2 extraction failed: {e}")
             return None
 
+    def _pypdf2_page_text(self, pdf_reader, page_num: int) -> Optional[str]:
+        try:
+            return pdf_reader.pages[page_num - 1].extract_text()
+        except Exception as e:
+            logger.warning(f"PyPDF2 fallback failed for page {page_num}: {e}")
+            return None
+
     def _format_table(self, table: List[List]) -> str:
         if not table:
             return ""
@@ -97,7 +120,7 @@ class PDFExtractor:
     def _clean_text(self, text: str) -> str:
         lines = [line.strip() for line in text.split('\n') if line.strip()]
         text = "\n".join(lines)
-        text = re.sub(r' +', ' ', text)
+        text = _SPACE_RUN_RE.sub(' ', text)
         return text
 
     def get_page_count(self, pdf_path: str) -> int:
@@ -1,40 +1,103 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import FileResponse, ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial, lru_cache
+from urllib.parse import quote
 import pdfplumber
+import pypdfium2 as pdfium
 import json
+import orjson
 import uuid
+import hashlib
 import logging
 import asyncio
+import threading
+import shutil
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Literal, BinaryIO
 import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+import xlsxwriter
 import os
 from dotenv import load_dotenv
 import re
 import time
 import httpx
 from aiolimiter import AsyncLimiter
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from tenacity import retry, stop_after_attempt, wait_exponential_jitter, retry_if_exception_type
 
 load_dotenv()
 
 # Setup
 UPLOAD_DIR = Path("uploads")
 OUTPUT_DIR = Path("outputs")
-HISTORY_FILE = Path("history.json")
+HISTORY_FILE = Path("history.json")  # legacy JSON array, migrated into HISTORY_LOG
+HISTORY_LOG = Path("history.jsonl")  # append-only, one session per line
+CACHE_DIR = OUTPUT_DIR / ".extraction_cache"
+TEXT_CACHE_DIR = UPLOAD_DIR / ".text_cache"  # extracted text by PDF content hash
 
-for d in [UPLOAD_DIR, OUTPUT_DIR]:
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+ALLOWED_EXTENSIONS = frozenset({".pdf"})
+
+for d in [UPLOAD_DIR, OUTPUT_DIR, CACHE_DIR, TEXT_CACHE_DIR]:
     d.mkdir(exist_ok=True)
 
+# PDF text extraction: PDFium (native) by default; PDF_TEXT_ENGINE=pdfplumber
+# selects pdfplumber, whose pages are parsed in blocks on a process pool
+# (pdfminer is pure Python, so threads would serialize on the GIL)
+PDF_TEXT_ENGINE = os.getenv("PDF_TEXT_ENGINE", "pdfium")
+PDFIUM_LOCK = threading.Lock()  # PDFium is not thread-safe
+MAX_PDF_PAGES = 15
+PAGE_BLOCK_SIZE = 4
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(os.cpu_count() or 1, 4))))
+PDF_POOL: Optional[ProcessPoolExecutor] = None  # created in lifespan
+
+# Only cache extractions the LLM filled in confidently
+CACHE_MIN_CONFIDENCE = float(os.getenv("CACHE_MIN_CONFIDENCE", "90"))
+# Entries kept per cache directory; least recently used are pruned beyond this
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "500"))
+# Per-batch LLM responses are reused for this long (seconds)
+BATCH_CACHE_MAX_AGE = float(os.getenv("BATCH_CACHE_MAX_AGE", "86400"))
+# Sheets requested per LLM call: fewer calls resend the PDF text less often,
+# smaller batches come back sooner since they are generated in parallel
+SHEETS_PER_CALL = max(1, int(os.getenv("SHEETS_PER_CALL", "3")))
+
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """App startup/shutdown: session history, eager tasks, pooled HTTP client, PDF pool"""
+    global PDF_POOL
+    await asyncio.to_thread(load_sessions)
+    
+    # Start coroutines eagerly where supported (Python 3.12+): tasks that finish
+    # without suspending skip a trip through the event loop
+    eager_task_factory = getattr(asyncio, "eager_task_factory", None)
+    if eager_task_factory is not None:
+        asyncio.get_running_loop().set_task_factory(eager_task_factory)
+    
+    # One long-lived client per worker: LLM calls reuse pooled keep-alive connections.
+    # HTTP/2 multiplexes concurrent batch calls over one TLS connection, and idle
+    # connections are kept for a minute (httpx default: 5s) so the next upload skips the handshake.
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=90.0,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0)
+    )
+    if PDF_WORKERS > 1:
+        PDF_POOL = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    yield
+    await app.state.http.aclose()
+    if PDF_POOL is not None:
+        PDF_POOL.shutdown(cancel_futures=True)
+        PDF_POOL = None
+
 # FastAPI
-app = FastAPI(title="Velocity.ai PDF Extraction")
+app = FastAPI(title="Velocity.ai PDF Extraction", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 origins = [
     "https://velocity-ai-q228.onrender.com",
@@ -53,11 +116,30 @@ app.add_middleware(
 # API Keys
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 
-# Rate limiter: 1 request per 3 seconds for Mistral free tier (20 req/min)
-rate_limiter = AsyncLimiter(max_rate=1, time_period=3)
+# Rate limiter: requests are spaced evenly to the account's quota
+# (default 20 req/min, i.e. 1 request per 3 seconds, for the Mistral free tier)
+MISTRAL_REQUESTS_PER_MINUTE = float(os.getenv("MISTRAL_REQUESTS_PER_MINUTE", "20"))
+rate_limiter = AsyncLimiter(max_rate=1, time_period=60 / MISTRAL_REQUESTS_PER_MINUTE)
 
-# HTTP client with connection pooling
-http_client = httpx.AsyncClient(timeout=90.0, limits=httpx.Limits(max_connections=5))
+# Cap extractions running LLM calls at once; the rest wait instead of piling onto the rate limiter
+EXTRACT_SEM = asyncio.Semaphore(int(os.getenv("EXTRACT_CONCURRENCY", "8")))
+
+# 429 backoff: the server's Retry-After (capped) when it sends one, else jittered exponential
+RETRY_AFTER_MAX = 30.0
+_backoff_wait = wait_exponential_jitter(initial=2, max=4, jitter=1)
+
+def wait_retry_after(retry_state) -> float:
+    """tenacity wait: honor a numeric Retry-After header on the failed response"""
+    exc = retry_state.outcome.exception()
+    retry_after = exc.response.headers.get("retry-after") if isinstance(exc, httpx.HTTPStatusError) else None
+    try:
+        return min(max(float(retry_after), 0.0), RETRY_AFTER_MAX)
+    except (TypeError, ValueError):
+        # Missing, or an HTTP-date
+        return _backoff_wait(retry_state)
+
+# Decoder for JSON embedded in text (orjson has no raw_decode equivalent)
+JSON_DECODER = json.JSONDecoder()
 
 # Template configs
 TEMPLATES = {
@@ -87,27 +169,193 @@ TEMPLATES = {
     }
 }
 
-def extract_pdf_text(pdf_path: Path) -> str:
+# Form validation rejects unknown templates with a 422 before the handler runs
+TemplateId = Literal[tuple(TEMPLATES)]
+
+def page_block_text(pdf: pdfplumber.PDF) -> str:
+    """Text of every page the PDF was opened with, in PAGE-marked form"""
+    parts = []
+    for page in pdf.pages:
+        page_text = page.extract_text() or ""
+        # Drop the page's parsed layout objects so memory stays flat across pages
+        page.flush_cache()
+        if page_text.strip():
+            parts.append(f"\n=== PAGE {page.page_number} ===\n{page_text}")
+    return "".join(parts)
+
+def extract_page_block(pdf_path: Path, first: int, last: int) -> str:
+    """Text of pages [first, last) of a PDF on disk (runs in pool workers)"""
+    # pages= is 1-based; pdfplumber only builds Page objects for these
+    with pdfplumber.open(pdf_path, pages=list(range(first + 1, last + 1))) as pdf:
+        return page_block_text(pdf)
+
+def extract_text_pdfium(src: BinaryIO) -> str:
+    """Text of the first MAX_PDF_PAGES pages via PDFium, in PAGE-marked form"""
+    parts = []
+    with PDFIUM_LOCK:
+        src.seek(0)
+        pdf = pdfium.PdfDocument(src)
+        try:
+            for i in range(min(len(pdf), MAX_PDF_PAGES)):
+                page = pdf[i]
+                textpage = page.get_textpage()
+                page_text = textpage.get_text_range().replace("\r\n", "\n")
+                textpage.close()
+                page.close()
+                if page_text.strip():
+                    parts.append(f"\n=== PAGE {i+1} ===\n{page_text}")
+        finally:
+            pdf.close()
+    return "".join(parts)
+
+def extract_text_pdfplumber(src: BinaryIO) -> str:
+    """Text of the first MAX_PDF_PAGES pages via pdfplumber, in PAGE-marked form"""
+    src.seek(0)
+    # Max 15 pages for speed; pages past that never get Page objects
+    with pdfplumber.open(src, pages=list(range(1, MAX_PDF_PAGES + 1))) as pdf:
+        page_count = len(pdf.pages)
+        if PDF_POOL is None or page_count <= PAGE_BLOCK_SIZE:
+            return page_block_text(pdf)
+    
+    # Blocks of pages amortize re-opening the PDF in each worker; map keeps page order.
+    # Workers open the PDF by path, so spill the upload to disk once for them.
+    blocks = [(i, min(i + PAGE_BLOCK_SIZE, page_count)) for i in range(0, page_count, PAGE_BLOCK_SIZE)]
+    pdf_path = UPLOAD_DIR / f"{uuid.uuid4()}.pdf"
+    try:
+        src.seek(0)
+        with open(pdf_path, "wb") as out:
+            shutil.copyfileobj(src, out, UPLOAD_CHUNK_SIZE)
+        return "".join(PDF_POOL.map(partial(extract_page_block, pdf_path), *zip(*blocks)))
+    finally:
+        pdf_path.unlink(missing_ok=True)
+
+def extract_pdf_text(src: BinaryIO) -> str:
     """Ultra-fast PDF extraction - 15 pages max"""
     start = time.time()
-    text = ""
     
-    with pdfplumber.open(pdf_path) as pdf:
-        for i, page in enumerate(pdf.pages[:15]):  # Max 15 pages for speed
-            page_text = page.extract_text() or ""
-            if page_text.strip():
-                text += f"\n=== PAGE {i+1} ===\n{page_text}"
+    text = None
+    if PDF_TEXT_ENGINE == "pdfium":
+        try:
+            text = extract_text_pdfium(src)
+        except pdfium.PdfiumError as e:
+            logger.warning(f"PDFium could not read the PDF ({e}), falling back to pdfplumber")
+    if text is None:
+        text = extract_text_pdfplumber(src)
     
     logger.info(f"PDF extracted in {time.time()-start:.2f}s ({len(text)} chars)")
-    return text[:40000]  # Limit to 40K chars for fast LLM processing
+    return truncate_at_line(text, 40000)  # Limit to 40K chars for fast LLM processing
+
+def truncate_at_line(text: str, limit: int) -> str:
+    """First `limit` chars of text, cut back to the last line break so no word or number is split"""
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit + 1)
+    # A line longer than a tenth of the budget isn't worth dropping whole
+    return text[:cut] if cut > limit * 0.9 else text[:limit]
+
+def hash_upload(src: BinaryIO) -> str:
+    """Content hash of an upload's spooled file, read in chunks, keying the text cache"""
+    digest = hashlib.blake2b(digest_size=20)
+    src.seek(0)
+    while chunk := src.read(UPLOAD_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def touch_cache_entry(path: Path):
+    """Mark a cache entry as recently used (pruning goes by mtime)"""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass  # pruned by another worker since it was read
+
+def write_cache_file(path: Path, data: bytes):
+    """Write a cache entry atomically: a temp file of its own, then rename over path"""
+    # Unique per writer: threads or workers saving the same key must not share a temp file
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+def prune_cache_dir(directory: Path, max_entries: int = CACHE_MAX_ENTRIES):
+    """Delete the least recently used entries beyond max_entries"""
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.endswith(".tmp"):
+                continue  # another writer's entry, not yet renamed into place
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+    if len(entries) <= max_entries:
+        return
+    
+    entries.sort()
+    for _, path in entries[:len(entries) - max_entries]:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass  # another worker pruned it first
+
+def extract_pdf_text_cached(src: BinaryIO) -> str:
+    """extract_pdf_text, reusing the result for a PDF with the same content hash"""
+    digest = hash_upload(src)
+    cache_path = TEXT_CACHE_DIR / f"{digest}_{PDF_TEXT_ENGINE}.txt"
+    try:
+        text = cache_path.read_text(encoding="utf-8")
+        logger.info(f"♻️ PDF text cache hit for {digest[:12]}")
+        touch_cache_entry(cache_path)
+        return text
+    except FileNotFoundError:
+        pass
+    
+    text = extract_pdf_text(src)
+    try:
+        write_cache_file(cache_path, text.encode("utf-8"))
+        prune_cache_dir(TEXT_CACHE_DIR)
+    except OSError as e:
+        # The text is in hand; a failed cache write only costs a later re-extract
+        logger.warning(f"Could not cache PDF text for {digest[:12]}: {e}")
+    return text
+
+# One scanner for aggressive_json_sanitization: strings are matched whole, so
+# quote flipping, literals, comments and trailing commas are only touched outside them
+_SANITIZE_TOKEN_RE = re.compile(r"""
+    "(?:[^"\\]|\\.|"(?!\s*[,:}\]]))*"  # double-quoted string (bare inner quotes allowed)
+  | '(?:[^'\\]|\\.)*'       # single-quoted (Python-style) string
+  | //[^\n]*               # line comment
+  | /\*.*?\*/              # block comment
+  | ,(?=\s*[}\]])           # trailing comma
+  | \b(?:None|True|False)\b # Python literals
+""", re.VERBOSE | re.DOTALL)
+_PY_LITERALS = {"None": "null", "True": "true", "False": "false"}
+# Raw control characters are invalid inside JSON strings
+_STRING_CONTROL_CHARS = str.maketrans({"\n": "\\n", "\r": "\\r", "\t": "\\t"})
+_BARE_QUOTE_RE = re.compile(r'(\\.)|"')
+
+def _sanitize_token(match: re.Match) -> str:
+    token = match.group()
+    first = token[0]
+    if first == '"':
+        inner = token[1:-1]
+        if '"' in inner:
+            inner = _BARE_QUOTE_RE.sub(lambda m: m.group(1) or '\\"', inner)
+        return f'"{inner}"'.translate(_STRING_CONTROL_CHARS)
+    if first == "'":
+        inner = token[1:-1].replace("\\'", "'").replace('\\"', '"').replace('"', '\\"')
+        return f'"{inner}"'.translate(_STRING_CONTROL_CHARS)
+    if first in "/,":
+        return ""
+    return _PY_LITERALS[token]
 
 def aggressive_json_sanitization(text: str) -> str:
     """Aggressive JSON cleaning to handle all edge cases"""
     
     # Remove markdown code blocks
-    text = re.sub(r'```json\s*', '', text)
-    text = re.sub(r'```\s*', '', text)
-    text = re.sub(r'`', '', text)
+    text = text.replace("```json", "").replace("`", "")
     
     # Find first { or [ and last } or ]
     start_brace = text.find('{')
@@ -129,28 +377,13 @@ def aggressive_json_sanitization(text: str) -> str:
     if end == -1:
         return "{}"
     
-    text = text[start:end+1]
-    
-    # Fix Python-style syntax
-    text = re.sub(r':\s*None\b', ': null', text)
-    text = re.sub(r':\s*True\b', ': true', text)
-    text = re.sub(r':\s*False\b', ': false', text)
-    
-    # Fix single quotes to double quotes (carefully)
-    text = text.replace("'", '"')
-    
-    # Remove trailing commas before closing brackets/braces
-    text = re.sub(r',(\s*[}\]])', r'\1', text)
-    
-    # Fix unescaped quotes in strings (basic attempt)
-    # This is tricky - doing a simple replacement
-    text = re.sub(r'(?<!\\)"([^"]*)"([^"]*)"', r'"\1\"\2"', text)
-    
-    # Remove comments
-    text = re.sub(r'//.*?\n', '', text)
-    text = re.sub(r'/\*.*?\*/', '', text, flags=re.DOTALL)
-    
-    return text.strip()
+    # Single pass: flip single-quoted strings, map None/True/False,
+    # drop comments and trailing commas
+    return _SANITIZE_TOKEN_RE.sub(_sanitize_token, text[start:end+1]).strip()
+
+_KEY_VALUE_RE = re.compile(r'"([^"]+)":\s*("(?:[^"\\]|\\.)*"|[\d.]+|true|false|null)', re.ASCII)
+_NUMBER_RE = re.compile(r'-?(?:\d+\.?\d*|\.\d+)', re.ASCII)
+FALLBACK_MAX_FIELDS = 500  # an endless malformed reply can't balloon the result
 
 def fallback_json_extraction(text: str) -> Dict:
     """Fallback: Extract key-value pairs when JSON fails"""
@@ -159,9 +392,8 @@ def fallback_json_extraction(text: str) -> Dict:
         result = {}
         
         # Pattern: "key": "value" or "key": number
-        patterns = re.findall(r'"([^"]+)":\s*("(?:[^"\\]|\\.)*"|[\d.]+|true|false|null)', text)
-        
-        for key, value in patterns:
+        for match in _KEY_VALUE_RE.finditer(text):
+            key, value = match.groups()
             # Clean value
             value = value.strip('"')
             
@@ -170,12 +402,15 @@ def fallback_json_extraction(text: str) -> Dict:
                 result[key] = value == 'true'
             elif value == 'null':
                 result[key] = None
-            elif value.replace('.', '').replace('-', '').isdigit():
+            elif _NUMBER_RE.fullmatch(value):
                 result[key] = float(value) if '.' in value else int(value)
             else:
                 result[key] = value
+            
+            if len(result) >= FALLBACK_MAX_FIELDS:
+                break
         
-        return result if result else {}
+        return result
     
     except Exception as e:
         logger.warning(f"Fallback extraction failed: {e}")
@@ -183,107 +418,78 @@ def fallback_json_extraction(text: str) -> Dict:
 
 @retry(
     stop=stop_after_attempt(2),  # Only 2 retries (not 3)
-    wait=wait_exponential(multiplier=2, min=2, max=4),  # Max 4 sec wait
+    wait=wait_retry_after,  # Retry-After when sent, else max 4 sec jittered so concurrent retries spread out
     retry=retry_if_exception_type(httpx.HTTPStatusError)
 )
-async def call_mistral_optimized(prompt: str, max_tokens: int = 4000) -> Dict:
-    """Optimized Mistral call with better error handling"""
-    async with rate_limiter:  # 1 request per 3 seconds
+async def call_mistral_optimized(prompt: str, max_tokens: int = 4000, system: Optional[str] = None) -> Tuple[Dict, bool]:
+    """Optimized Mistral call with better error handling.
+
+    Returns (data, clean): clean is False when the reply was not valid JSON and
+    data was only salvaged by sanitizing or key/value fallback (or the call failed).
+    """
+    messages = [{"role": "user", "content": prompt}]
+    if system:
+        messages.insert(0, {"role": "system", "content": system})
+    async with rate_limiter:  # 1 request per 60/MISTRAL_REQUESTS_PER_MINUTE seconds
         try:
-            response = await http_client.post(
+            response = await app.state.http.post(
                 "https://api.mistral.ai/v1/chat/completions",
                 headers={
                     "Authorization": f"Bearer {MISTRAL_API_KEY}",
                     "Content-Type": "application/json"
                 },
-                json={
+                content=orjson.dumps({
                     "model": "mistral-large-latest",
-                    "messages": [{"role": "user", "content": prompt}],
+                    "messages": messages,
                     "temperature": 0.1,
                     "max_tokens": max_tokens,
                     "response_format": {"type": "json_object"}  # Request JSON format
-                }
+                })
             )
             
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
             content = data["choices"][0]["message"]["content"]
             
             # Try standard JSON parse
             try:
-                return json.loads(content)
-            except json.JSONDecodeError:
-                # Try aggressive sanitization
-                logger.info("Standard JSON parse failed, trying sanitization...")
-                clean_json = aggressive_json_sanitization(content)
+                return orjson.loads(content), True
+            except orjson.JSONDecodeError:
+                pass
+            
+            # Decode the first object in place, ignoring prose/fences around it
+            start = content.find('{')
+            if start != -1:
                 try:
-                    return json.loads(clean_json)
+                    # orjson has no partial decode, so this one stays on the stdlib decoder
+                    return JSON_DECODER.raw_decode(content, start)[0], True
                 except json.JSONDecodeError:
-                    # Final fallback: extract key-value pairs
-                    logger.warning("JSON sanitization failed, using fallback extraction")
-                    return fallback_json_extraction(content)
+                    pass
+            
+            # Try aggressive sanitization
+            logger.info("Standard JSON parse failed, trying sanitization...")
+            clean_json = aggressive_json_sanitization(content)
+            try:
+                return orjson.loads(clean_json), False
+            except orjson.JSONDecodeError:
+                # Final fallback: extract key-value pairs
+                logger.warning("JSON sanitization failed, using fallback extraction")
+                return fallback_json_extraction(content), False
         
         except httpx.HTTPStatusError as e:
             if e.response.status_code == 429:
                 logger.warning("⚠️ Mistral 429: Rate limit hit, retrying with backoff...")
                 raise  # Let tenacity retry
             logger.error(f"Mistral HTTP {e.response.status_code}: {e}")
-            return {}
+            return {}, False
         
         except Exception as e:
             logger.error(f"Mistral error: {e}")
-            return {}
+            return {}, False
 
-def get_batch_prompt(sheet_names: List[str], pdf_text: str) -> str:
-    """Generate batched prompt for multiple sheets at once"""
-    
-    # Truncate for speed
-    text_sample = pdf_text[:35000]
-    
-    sheets_json = {}
-    for sheet in sheet_names:
-        if sheet == "Portfolio Summary":
-            sheets_json[sheet] = {
-                "Reporting Date": "string",
-                "QTR": "string",
-                "General Partner": "string",
-                "Assets Under Management": "number",
-                "Active Funds": "number",
-                "Active Portfolio Companies": "number",
-                "Total Commitments": "number",
-                "Total Drawdowns": "number",
-                "DPI": "number",
-                "RVPI": "number",
-                "TVPI": "number"
-            }
-        elif sheet == "Schedule of Investments":
-            sheets_json[sheet] = [
-                {
-                    "number": "number",
-                    "Company": "string",
-                    "Fund": "string",
-                    "Investment Status": "string",
-                    "Fund Ownership percentage": "string",
-                    "Total Invested": "number",
-                    "Reported Value": "number",
-                    "Investment Multiple": "number"
-                }
-            ]
-        elif sheet == "Statement of Operations":
-            sheets_json[sheet] = [
-                {
-                    "Period": "string",
-                    "Portfolio Interest Income": "number",
-                    "Total income": "number",
-                    "Management Fees Net": "number",
-                    "Total expenses": "number",
-                    "Net Operating Income": "number"
-                }
-            ]
-        else:
-            sheets_json[sheet] = {"description": "Extract all relevant data"}
-    
-    prompt = f"""You are a financial data extraction expert. Extract data from this PDF and structure it EXACTLY as specified.
+# Static instructions go in the system message so every extraction request
+# shares an identical prefix; only the PDF text and schema vary per call.
+EXTRACTION_SYSTEM_PROMPT = """You are a financial data extraction expert. Extract data from the PDF text you are given and structure it EXACTLY as specified.
 
 CRITICAL INSTRUCTIONS:
 1. Return ONLY a single valid JSON object
@@ -291,23 +497,79 @@ CRITICAL INSTRUCTIONS:
 3. Do not include trailing commas
 4. Wrap all strings in double quotes
 5. Use null for missing values (not "Not found" or empty strings)
-6. Ensure all brackets and braces are properly closed
-
-PDF TEXT:
-{text_sample}
+6. Ensure all brackets and braces are properly closed"""
 
-REQUIRED OUTPUT STRUCTURE:
-{json.dumps(sheets_json, indent=2)}
+# Output schema per sheet; sheets not listed fall back to DEFAULT_SHEET_SCHEMA
+SHEET_SCHEMAS = {
+    "Portfolio Summary": {
+        "Reporting Date": "string",
+        "QTR": "string",
+        "General Partner": "string",
+        "Assets Under Management": "number",
+        "Active Funds": "number",
+        "Active Portfolio Companies": "number",
+        "Total Commitments": "number",
+        "Total Drawdowns": "number",
+        "DPI": "number",
+        "RVPI": "number",
+        "TVPI": "number"
+    },
+    "Schedule of Investments": [
+        {
+            "number": "number",
+            "Company": "string",
+            "Fund": "string",
+            "Investment Status": "string",
+            "Fund Ownership percentage": "string",
+            "Total Invested": "number",
+            "Reported Value": "number",
+            "Investment Multiple": "number"
+        }
+    ],
+    "Statement of Operations": [
+        {
+            "Period": "string",
+            "Portfolio Interest Income": "number",
+            "Total income": "number",
+            "Management Fees Net": "number",
+            "Total expenses": "number",
+            "Net Operating Income": "number"
+        }
+    ]
+}
+DEFAULT_SHEET_SCHEMA = {"description": "Extract all relevant data"}
 
-Return ONLY valid JSON matching this exact structure. Fill in actual values from the PDF, use null for missing data."""
+@lru_cache(maxsize=32)
+def batch_output_structure(sheet_names: Tuple[str, ...]) -> str:
+    """Rendered REQUIRED OUTPUT STRUCTURE block for a batch of sheets (same batches recur per template)"""
+    sheets_json = {sheet: SHEET_SCHEMAS.get(sheet, DEFAULT_SHEET_SCHEMA) for sheet in sheet_names}
+    return (
+        "REQUIRED OUTPUT STRUCTURE:\n"
+        f"{orjson.dumps(sheets_json, option=orjson.OPT_INDENT_2).decode()}\n\n"
+        "Return ONLY valid JSON matching this exact structure. Fill in actual values from the PDF text below, use null for missing data."
+    )
 
-    return prompt
+def get_batch_prompt(sheet_names: List[str], pdf_text: str) -> str:
+    """Generate the batched user message for multiple sheets at once"""
+    # Schema first, PDF text last: the stable part forms a cacheable prefix.
+    # Truncate for speed
+    return f"{batch_output_structure(tuple(sheet_names))}\n\nPDF TEXT:\n{truncate_at_line(pdf_text, 35000)}"
 
 async def extract_batch_sheets(sheet_names: List[str], pdf_text: str) -> Dict:
     """Extract multiple sheets in a single LLM call"""
     try:
         prompt = get_batch_prompt(sheet_names, pdf_text)
-        result = await call_mistral_optimized(prompt, max_tokens=5000)
+        
+        # Same prompt (sheets + text + schema), same answer: reuse it across templates and requests
+        cache_key = hashlib.sha256(f"{EXTRACTION_SYSTEM_PROMPT}\n{prompt}".encode("utf-8")).hexdigest()
+        cached = await asyncio.to_thread(load_cached_batch, cache_key)
+        if cached is not None:
+            logger.info(f"♻️ Batch cache hit for {sheet_names}")
+            return cached
+        
+        # Larger batches need room for more output before the JSON gets cut off
+        max_tokens = min(8000, max(5000, 1700 * len(sheet_names)))
+        result, clean = await call_mistral_optimized(prompt, max_tokens=max_tokens, system=EXTRACTION_SYSTEM_PROMPT)
         
         if not result:
             logger.warning(f"Empty result for batch {sheet_names}")
@@ -318,414 +580,631 @@ async def extract_batch_sheets(sheet_names: List[str], pdf_text: str) -> Dict:
             if sheet not in result:
                 result[sheet] = {}
         
+        # Only a reply that parsed as JSON and filled its sheets as well as the
+        # extraction cache requires is reused; anything weaker is retried next time
+        if clean and batch_is_cacheable(result, sheet_names):
+            try:
+                await asyncio.to_thread(save_cached_batch, cache_key, result)
+            except Exception as e:
+                # The response is already paid for: a failed cache write must not discard it
+                logger.warning(f"Could not cache batch {sheet_names}: {e}")
         return result
     
     except Exception as e:
         logger.error(f"Batch extraction failed for {sheet_names}: {e}")
         return {sheet: {} for sheet in sheet_names}
 
+async def extract_all_sheets(sheet_names: List[str], pdf_text: str) -> Dict:
+    """Extract every sheet, SHEETS_PER_CALL sheets per LLM call, with all batches in flight together"""
+    batches = [sheet_names[i:i+SHEETS_PER_CALL] for i in range(0, len(sheet_names), SHEETS_PER_CALL)]
+    logger.info(f"📋 Processing {len(sheet_names)} sheets in {len(batches)} concurrent batches of {SHEETS_PER_CALL}...")
+    
+    # rate_limiter spaces out the request starts; the responses overlap
+    batch_results = await asyncio.gather(
+        *(extract_batch_sheets(batch, pdf_text) for batch in batches),
+        return_exceptions=True
+    )
+    
+    all_results = {}
+    for batch_num, (batch, batch_result) in enumerate(zip(batches, batch_results), 1):
+        if isinstance(batch_result, BaseException):
+            logger.error(f"❌ Batch {batch_num} failed: {batch_result}")
+            # Graceful degradation: Add empty sheets
+            batch_result = {sheet: {} for sheet in batch}
+        else:
+            logger.info(f"✅ Batch {batch_num} complete")
+        all_results.update(batch_result)
+    
+    return all_results
+
+def extraction_fingerprint(template_id: str, pdf_text: str) -> str:
+    """Fingerprint of template + extracted PDF text, used as the cache key"""
+    return hashlib.sha256(f"{template_id}\n{pdf_text}".encode("utf-8")).hexdigest()
+
+def load_cached_extraction(fingerprint: str) -> Optional[Dict]:
+    """Return a previously extracted result for identical documents, if any"""
+    path = CACHE_DIR / f"{fingerprint}.json"
+    if not path.exists():
+        return None
+    
+    try:
+        data = orjson.loads(path.read_bytes())
+    except (OSError, orjson.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable cache entry {path.name}: {e}")
+        return None
+    
+    touch_cache_entry(path)
+    return data
+
+def save_cached_extraction(fingerprint: str, data: Dict):
+    """Persist an extraction result (write to temp file, then atomic rename)"""
+    path = CACHE_DIR / f"{fingerprint}.json"
+    write_cache_file(path, orjson.dumps(data))
+    prune_cache_dir(CACHE_DIR)
+
+def load_cached_batch(key: str) -> Optional[Dict]:
+    """Return a batch response saved less than BATCH_CACHE_MAX_AGE ago, if any"""
+    path = CACHE_DIR / f"batch_{key}.json"
+    try:
+        entry = orjson.loads(path.read_bytes())
+    except FileNotFoundError:
+        return None
+    except (OSError, orjson.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable cache entry {path.name}: {e}")
+        return None
+    
+    if time.time() - entry["saved_at"] > BATCH_CACHE_MAX_AGE:
+        return None
+    touch_cache_entry(path)
+    return entry["result"]
+
+def save_cached_batch(key: str, result: Dict):
+    """Persist a batch response with its save time (write to temp file, then atomic rename)"""
+    path = CACHE_DIR / f"batch_{key}.json"
+    write_cache_file(path, orjson.dumps({"saved_at": time.time(), "result": result}))
+    prune_cache_dir(CACHE_DIR)
+
 def safe_excel_value(value: Any) -> Any:
     """Convert any value to Excel-safe format"""
+    value_type = type(value)
+    
+    # Numbers and booleans go to Excel as-is
+    if value_type is int or value_type is float or value_type is bool:
+        return value
+    
     if value is None or value == "null":
         return "Not found"
     
     # Convert complex types to strings
-    if isinstance(value, (dict, list)):
-        return json.dumps(value, indent=2)
+    if value_type is dict or value_type is list:
+        try:
+            value = orjson.dumps(value, option=orjson.OPT_INDENT_2).decode()
+        except TypeError:
+            # orjson rejects integers beyond 64 bits
+            value = json.dumps(value, indent=2, ensure_ascii=False)
+    elif value_type is not str:
+        value = str(value)
     
-    # Convert to string if too long
-    str_val = str(value)
-    if len(str_val) > 32000:
-        return str_val[:32000] + "..."
+    # Truncate text past Excel's cell limit
+    if len(value) > 32000:
+        return value[:32000] + "..."
     
     return value
 
+# String values the LLM uses for "no data"
+EMPTY_FIELD_VALUES = frozenset({"Not found", "null"})
+
+def count_fields(obj: Any) -> Tuple[int, int]:
+    """Walk nested dicts/lists with an explicit stack, returning (total_fields, filled_fields)"""
+    total = filled = 0
+    stack = [obj]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+            continue
+        if not isinstance(node, dict):
+            continue
+        
+        total += len(node)
+        for v in node.values():
+            if isinstance(v, str):
+                if v.strip() and v not in EMPTY_FIELD_VALUES:
+                    filled += 1
+            elif v:
+                # Non-empty containers count as filled and are walked too
+                filled += 1
+                if isinstance(v, (dict, list)):
+                    stack.append(v)
+    return total, filled
+
 def calculate_accuracy(data: Dict, template_id: str) -> float:
     """Calculate extraction accuracy"""
-    total_fields = 0
-    filled_fields = 0
-    
-    def count_fields(obj):
-        nonlocal total_fields, filled_fields
-        if isinstance(obj, dict):
-            for v in obj.values():
-                total_fields += 1
-                if v and str(v).strip() and v not in ("Not found", "null", None):
-                    filled_fields += 1
-                if isinstance(v, (dict, list)):
-                    count_fields(v)
-        elif isinstance(obj, list):
-            for item in obj:
-                count_fields(item)
-    
-    count_fields(data)
+    total_fields, filled_fields = count_fields(data)
     
     accuracy = (filled_fields / total_fields * 100) if total_fields > 0 else 0
     logger.info(f"✅ Accuracy: {accuracy:.1f}% ({filled_fields}/{total_fields} fields filled)")
     return round(accuracy, 2)
 
+def confidence_from_accuracy(accuracy: float) -> float:
+    """Confidence reported for an extraction (and compared to CACHE_MIN_CONFIDENCE)"""
+    return min(accuracy + 5, 100)
+
+def batch_is_cacheable(result: Dict, sheet_names: List[str]) -> bool:
+    """True when the requested sheets hold data and clear CACHE_MIN_CONFIDENCE"""
+    sheets = {sheet: result.get(sheet) for sheet in sheet_names}
+    if not any(isinstance(v, (dict, list)) and v for v in sheets.values()):
+        return False
+    total_fields, filled_fields = count_fields(sheets)
+    accuracy = filled_fields / total_fields * 100 if total_fields else 0
+    return confidence_from_accuracy(accuracy) >= CACHE_MIN_CONFIDENCE
+
+def write_excel_row(ws, row_idx: int, values: List[Any], cell_format, col_widths: Dict[int, int]):
+    """Write one row and track the widest value per column for auto-width"""
+    ws.write_row(row_idx, 0, values, cell_format)
+    for col, value in enumerate(values):
+        col_widths[col] = max(col_widths.get(col, 0), len(str(value)))
+
+# Column headers per sheet; sheets not listed get Field/Value
+DEFAULT_HEADERS = {
+    "Portfolio Summary": ["Field", "Value"],
+    "Schedule of Investments": [
+        "#", "Company", "Fund", "Investment Status", "Security Type",
+        "Fund Ownership %", "Initial Investment Date", "Fund Commitment",
+        "Total Invested (A)", "Reported Value (C)", "Investment Multiple", "Since Inception IRR"
+    ],
+    "Statement of Operations": [
+        "Period", "Portfolio Interest Income", "Portfolio Dividend Income", "Total income",
+        "Management Fees, Net", "Total expenses", "Net Operating Income / (Deficit)"
+    ],
+    "Statement of Cashflows": [
+        "Description", "Net increase in partners capital", "Purchase of investments",
+        "Capital contributions", "Distributions", "Cash at end of period"
+    ],
+    "PCAP Statement": [
+        "Description", "Beginning NAV", "Contributions", "Distributions", "Ending NAV"
+    ],
+    "Portfolio Company Profile": [
+        "#", "Company Name", "Initial Investment Date", "Industry", "Headquarters",
+        "Company Description", "Fund Ownership %", "Investment Commitment"
+    ],
+    "Portfolio Company Financials": [
+        "Company", "Company Currency", "LTM Revenue", "LTM EBITDA", "EBITDA Margin"
+    ],
+    "Footnotes": ["Note #", "Note Header", "Description"],
+    "Reference": ["Field", "Value"],
+    "Invoice Details": ["Field", "Value"],
+    "Line Items": ["Item", "Description", "Quantity", "Price", "Amount"],
+    "Summary": ["Field", "Value"],
+    "Document Info": ["Field", "Value"],
+    "Content": ["Section", "Content"],
+    "Metadata": ["Property", "Value"]
+}
+
+# (sheet name, default headers) per template, resolved once instead of per workbook
+SHEET_PLANS = {
+    tid: tuple((sheet, DEFAULT_HEADERS.get(sheet, ["Field", "Value"])) for sheet in t["sheet_names"])
+    for tid, t in TEMPLATES.items()
+}
+
 def create_excel(data: Dict, template_id: str, output_path: Path, metadata: Dict):
-    """Create Excel with guaranteed headers and safe values"""
-    wb = openpyxl.Workbook()
-    wb.remove(wb.active)
+    """Create Excel with guaranteed headers and safe values (streamed row by row)"""
+    # constant_memory flushes each row to disk as soon as the next one starts;
+    # extracted text is written as plain strings, not scanned for URLs to hyperlink
+    wb = xlsxwriter.Workbook(str(output_path), {'constant_memory': True, 'strings_to_urls': False})
     
     # Styles
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_align = Alignment(horizontal="center", vertical="center", wrap_text=True)
-    border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    
-    sheet_names = TEMPLATES[template_id]["sheet_names"]
-    
-    # Default headers
-    DEFAULT_HEADERS = {
-        "Portfolio Summary": ["Field", "Value"],
-        "Schedule of Investments": [
-            "#", "Company", "Fund", "Investment Status", "Security Type",
-            "Fund Ownership %", "Initial Investment Date", "Fund Commitment",
-            "Total Invested (A)", "Reported Value (C)", "Investment Multiple", "Since Inception IRR"
-        ],
-        "Statement of Operations": [
-            "Period", "Portfolio Interest Income", "Portfolio Dividend Income", "Total income",
-            "Management Fees, Net", "Total expenses", "Net Operating Income / (Deficit)"
-        ],
-        "Statement of Cashflows": [
-            "Description", "Net increase in partners capital", "Purchase of investments",
-            "Capital contributions", "Distributions", "Cash at end of period"
-        ],
-        "PCAP Statement": [
-            "Description", "Beginning NAV", "Contributions", "Distributions", "Ending NAV"
-        ],
-        "Portfolio Company Profile": [
-            "#", "Company Name", "Initial Investment Date", "Industry", "Headquarters",
-            "Company Description", "Fund Ownership %", "Investment Commitment"
-        ],
-        "Portfolio Company Financials": [
-            "Company", "Company Currency", "LTM Revenue", "LTM EBITDA", "EBITDA Margin"
-        ],
-        "Footnotes": ["Note #", "Note Header", "Description"],
-        "Reference": ["Field", "Value"],
-        "Invoice Details": ["Field", "Value"],
-        "Line Items": ["Item", "Description", "Quantity", "Price", "Amount"],
-        "Summary": ["Field", "Value"],
-        "Document Info": ["Field", "Value"],
-        "Content": ["Section", "Content"],
-        "Metadata": ["Property", "Value"]
-    }
+    header_fmt = wb.add_format({
+        'bold': True, 'font_color': 'white', 'bg_color': '#366092',
+        'align': 'center', 'valign': 'vcenter', 'text_wrap': True, 'border': 1
+    })
+    cell_fmt = wb.add_format({'border': 1})
     
-    for sheet_name in sheet_names:
-        ws = wb.create_sheet(title=sheet_name)
+    for sheet_name, headers in SHEET_PLANS[template_id]:
+        ws = wb.add_worksheet(sheet_name)
         sheet_data = data.get(sheet_name, {})
+        col_widths = {}
         
-        # Get headers
-        headers = DEFAULT_HEADERS.get(sheet_name, ["Field", "Value"])
+        # Tables take their headers from the extracted rows
+        if isinstance(sheet_data, list) and sheet_data and isinstance(sheet_data[0], dict):
+            headers = list(sheet_data[0].keys())
+        
+        # Header row
+        write_excel_row(ws, 0, headers, header_fmt, col_widths)
+        row_idx = 1
         
         if isinstance(sheet_data, dict) and sheet_data:
             # Key-value format
-            ws.append(headers)
             for k, v in sheet_data.items():
-                safe_v = safe_excel_value(v)
-                ws.append([k, safe_v])
+                write_excel_row(ws, row_idx, [k, safe_excel_value(v)], cell_fmt, col_widths)
+                row_idx += 1
         
         elif isinstance(sheet_data, list) and sheet_data:
             # Table format
-            if sheet_data and isinstance(sheet_data[0], dict):
-                headers = list(sheet_data[0].keys())
-            ws.append(headers)
             for row in sheet_data:
                 row_data = [safe_excel_value(row.get(h, "Not found")) for h in headers]
-                ws.append(row_data)
+                write_excel_row(ws, row_idx, row_data, cell_fmt, col_widths)
+                row_idx += 1
         
         else:
             # Empty sheet - still add headers
-            ws.append(headers)
-            ws.append(["Not found"] * len(headers))
-        
-        # Style header
-        for cell in ws[1]:
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_align
-            cell.border = border
-        
-        # Borders for all cells
-        for row in ws.iter_rows(min_row=2):
-            for cell in row:
-                cell.border = border
-        
-        # Auto-width
-        for col in ws.columns:
-            max_len = 0
-            col_letter = col[0].column_letter
-            for cell in col:
-                try:
-                    max_len = max(max_len, len(str(cell.value)))
-                except:
-                    pass
-            ws.column_dimensions[col_letter].width = min(max_len + 2, 50)
+            write_excel_row(ws, row_idx, ["Not found"] * len(headers), cell_fmt, col_widths)
+        
+        # Auto-width from the widths tracked while writing
+        for col, max_len in col_widths.items():
+            ws.set_column(col, col, min(max_len + 2, 50))
     
     # Metadata sheet
-    ws_meta = wb.create_sheet(title="Extraction Metadata")
-    ws_meta.append(["Metric", "Value"])
-    ws_meta.append(["Template", TEMPLATES[template_id]["name"]])
-    ws_meta.append(["Processed At", metadata.get("timestamp", "")])
-    ws_meta.append(["Processing Time (s)", metadata.get("processing_time", "")])
-    ws_meta.append(["LLM Model", "Mistral Large"])
-    ws_meta.append(["Accuracy (%)", metadata.get("accuracy", "")])
-    ws_meta.append(["Confidence (%)", metadata.get("confidence", "")])
-    
-    for cell in ws_meta[1]:
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.border = border
-    
-    wb.save(output_path)
+    ws_meta = wb.add_worksheet("Extraction Metadata")
+    ws_meta.write_row(0, 0, ["Metric", "Value"], header_fmt)
+    meta_rows = [
+        ["Template", TEMPLATES[template_id]["name"]],
+        ["Processed At", metadata.get("timestamp", "")],
+        ["Processing Time (s)", metadata.get("processing_time", "")],
+        ["LLM Model", "Mistral Large"],
+        ["Accuracy (%)", metadata.get("accuracy", "")],
+        ["Confidence (%)", metadata.get("confidence", "")],
+    ]
+    for row_idx, row in enumerate(meta_rows, 1):
+        ws_meta.write_row(row_idx, 0, row)
+    
+    wb.close()
     logger.info(f"📊 Excel created: {output_path}")
 
+# History persistence: append-only JSONL on disk + in-memory index
+# (blocking file I/O; call via asyncio.to_thread from async handlers)
+# The log is the source of truth shared by all uvicorn workers: each process
+# indexes lines past HISTORY_OFFSET before reading, so sessions written by
+# another worker become visible without a restart.
+HISTORY_LOCK = threading.Lock()
+SESSION_LIST: List[Dict] = []  # in append order, as /api/history returns them
+SESSIONS: Dict[str, Dict] = {}  # session_id -> first session with that id
+HISTORY_OFFSET = 0  # bytes of HISTORY_LOG already indexed
+
+# Serialized /api/history body, keyed by number of sessions (history only grows)
+HISTORY_RESPONSE_CACHE: Dict[str, Any] = {"count": None, "body": b""}
+
+# TEMPLATES is static, so /api/templates is serialized once at import
+TEMPLATES_RESPONSE_BODY = ORJSONResponse({
+    "templates": {
+        tid: {"name": t["name"], "sheets": t["sheets"]}
+        for tid, t in TEMPLATES.items()
+    }
+}).body
+
+def index_session(session: Dict):
+    """Add a session to the in-memory index"""
+    SESSION_LIST.append(session)
+    SESSIONS.setdefault(session["session_id"], session)
+
+def _index_new_lines():
+    """Index complete lines appended since HISTORY_OFFSET (caller holds HISTORY_LOCK)"""
+    global HISTORY_OFFSET
+    try:
+        size = HISTORY_LOG.stat().st_size
+    except FileNotFoundError:
+        return
+    if size <= HISTORY_OFFSET:
+        return
+    
+    with open(HISTORY_LOG, 'rb') as f:
+        f.seek(HISTORY_OFFSET)
+        chunk = f.read(size - HISTORY_OFFSET)
+    
+    # Leave a line another worker is still writing for the next sync
+    end = chunk.rfind(b"\n") + 1
+    for line in chunk[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            index_session(orjson.loads(line))
+        except orjson.JSONDecodeError as e:
+            # A crash mid-append can leave a torn line
+            logger.warning(f"Skipping unreadable history line: {e}")
+    HISTORY_OFFSET += end
+
+def load_sessions():
+    """Build the in-memory index with one sequential scan of the history log"""
+    global HISTORY_OFFSET
+    with HISTORY_LOCK:
+        if not HISTORY_LOG.exists() and HISTORY_FILE.exists():
+            # One-time migration from the legacy history.json array
+            legacy = orjson.loads(HISTORY_FILE.read_bytes() or b"[]")
+            try:
+                # 'x' so only one worker migrates when several start together
+                with open(HISTORY_LOG, 'xb') as f:
+                    f.write(b"".join(orjson.dumps(session) + b"\n" for session in legacy))
+                logger.info(f"Migrated {len(legacy)} sessions from {HISTORY_FILE} to {HISTORY_LOG}")
+            except FileExistsError:
+                pass
+        
+        SESSION_LIST.clear()
+        SESSIONS.clear()
+        HISTORY_OFFSET = 0
+        _index_new_lines()
+
+def sync_sessions():
+    """Pick up sessions other workers appended to the history log"""
+    with HISTORY_LOCK:
+        _index_new_lines()
+
+def load_history() -> List[Dict]:
+    """All saved sessions, oldest first"""
+    sync_sessions()
+    return SESSION_LIST
+
+def add_session(session: Dict):
+    """Append a session to the history log and the in-memory index"""
+    with HISTORY_LOCK:
+        # Single O_APPEND write, so lines from concurrent workers don't interleave
+        with open(HISTORY_LOG, 'ab') as f:
+            f.write(orjson.dumps(session) + b"\n")
+        # Index through the log so lines other workers wrote first keep their order
+        _index_new_lines()
+
+def summarize_workbook(excel_path: Path) -> Dict:
+    """First 10 rows of the first 5 sheets, as strings, for chat prompts"""
+    # Read-only mode streams rows from the XML instead of building every Cell up front
+    wb = openpyxl.load_workbook(excel_path, read_only=True)
+    try:
+        data_summary = {}
+        for sheet in wb.sheetnames[:5]:
+            ws = wb[sheet]
+            data_summary[sheet] = [[str(cell.value) for cell in row] for row in ws.iter_rows(max_row=10)]
+    finally:
+        wb.close()
+    
+    return data_summary
+
+@lru_cache(maxsize=64)
+def workbook_summary_json(excel_path: Path) -> str:
+    """summarize_workbook rendered for the chat prompt, kept across chat turns"""
+    # Output files are never rewritten once a session points at them
+    return orjson.dumps(summarize_workbook(excel_path), option=orjson.OPT_INDENT_2).decode()
+
 # API endpoints
 @app.post("/api/extract")
-async def extract(files: List[UploadFile] = File(...), template_id: str = Form(...)):
+async def extract(files: List[UploadFile] = File(...), template_id: TemplateId = Form(...)):
     """Optimized extraction with batching and better error handling"""
     start_time = time.time()
     session_id = str(uuid.uuid4())[:8]
     
     logger.info(f"🚀 Session {session_id}: Starting OPTIMIZED extraction with {template_id}")
     
+    # Reject unsupported uploads before any disk or LLM work
+    accepted, skipped = [], []
+    for f in files:
+        if Path(f.filename or "").suffix.lower() in ALLOWED_EXTENSIONS:
+            accepted.append(f)
+        else:
+            skipped.append(f)
+    if not accepted:
+        raise HTTPException(415, "No PDF files found")
+    
     try:
-        if template_id not in TEMPLATES:
-            raise HTTPException(400, "Invalid template")
-        
-        # Save files
-        pdf_paths = []
-        for f in files:
-            if not f.filename.lower().endswith('.pdf'):
-                continue
-            path = UPLOAD_DIR / f"{uuid.uuid4()}_{f.filename}"
-            with open(path, "wb") as fp:
-                fp.write(await f.read())
-            pdf_paths.append((path, f.filename))
-        
-        if not pdf_paths:
-            raise HTTPException(400, "No PDF files found")
-        
-        # Extract text (1-2s with 15 page limit)
+        # Extract text (1-2s with 15 page limit); files are extracted concurrently on worker threads.
+        # Read straight from the uploads' spooled temp files, no copy into UPLOAD_DIR.
         extract_start = time.time()
-        texts = []
-        for path, name in pdf_paths:
-            texts.append(extract_pdf_text(path))
-            path.unlink()
+        sheet_names = TEMPLATES[template_id]["sheet_names"]
+        texts = await asyncio.gather(*(asyncio.to_thread(extract_pdf_text_cached, f.file) for f in accepted))
+        pdf_names = [f.filename for f in accepted]
+        file_count = len(pdf_names)
         
         combined_text = "\n\n=== NEXT DOCUMENT ===\n\n".join(texts)
         extraction_time = time.time() - extract_start
         
-        # BATCHED EXTRACTION: Process 3 sheets per LLM call (9 sheets → 3 calls)
+        # Identical documents were already extracted: reuse the result, skip the LLM
         llm_start = time.time()
-        sheet_names = TEMPLATES[template_id]["sheet_names"]
+        fingerprint = extraction_fingerprint(template_id, combined_text)
+        cached = await asyncio.to_thread(load_cached_extraction, fingerprint)
         
-        logger.info(f"📋 Processing {len(sheet_names)} sheets in batches of 3...")
-        
-        # Process in batches of 3
-        all_results = {}
-        for i in range(0, len(sheet_names), 3):
-            batch = sheet_names[i:i+3]
-            batch_num = (i // 3) + 1
-            total_batches = (len(sheet_names) + 2) // 3
-            
-            logger.info(f"⏳ Batch {batch_num}/{total_batches}: {', '.join(batch)}")
-            
-            try:
-                batch_result = await extract_batch_sheets(batch, combined_text)
-                all_results.update(batch_result)
-                logger.info(f"✅ Batch {batch_num} complete")
-            except Exception as e:
-                logger.error(f"❌ Batch {batch_num} failed: {e}")
-                # Graceful degradation: Add empty sheets
-                for sheet in batch:
-                    all_results[sheet] = {}
-            
-            # Wait between batches (except last one)
-            if i + 3 < len(sheet_names):
-                logger.info("⏸️  Waiting 3 seconds before next batch...")
-                await asyncio.sleep(3)
+        if cached is not None:
+            logger.info(f"♻️ Cache hit for {fingerprint[:12]}, skipping LLM calls")
+            all_results = cached
+        elif not combined_text.strip():
+            # No text layer in any file (scanned PDFs): the LLM has nothing to read
+            logger.warning(f"No extractable text in {pdf_names} (scanned PDF?), skipping LLM calls")
+            all_results = {sheet: {} for sheet in sheet_names}
+        else:
+            # BATCHED EXTRACTION: Process 3 sheets per LLM call (9 sheets → 3 calls)
+            async with EXTRACT_SEM:
+                all_results = await extract_all_sheets(sheet_names, combined_text)
         
         llm_time = time.time() - llm_start
         
         # Calculate accuracy
         accuracy = calculate_accuracy(all_results, template_id)
-        confidence = min(accuracy + 5, 100)
+        confidence = confidence_from_accuracy(accuracy)
+        
+        if cached is None and confidence >= CACHE_MIN_CONFIDENCE:
+            try:
+                await asyncio.to_thread(save_cached_extraction, fingerprint, all_results)
+            except Exception as e:
+                # The extraction succeeded; only reuse by later requests is lost
+                logger.warning(f"Could not cache extraction {fingerprint[:12]}: {e}")
         
         # Create Excel (2-3s)
-        output_filename = f"extraction_{template_id}_{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        # One clock read per request: the filename stamp and every ISO timestamp share it
+        now = datetime.now()
+        now_iso = now.isoformat()
+        output_filename = f"extraction_{template_id}_{session_id}_{now.strftime('%Y%m%d_%H%M%S')}.xlsx"
         output_path = OUTPUT_DIR / output_filename
         
         metadata = {
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now_iso,
             "processing_time": round(time.time() - start_time, 2),
             "extraction_time": round(extraction_time, 2),
             "llm_time": round(llm_time, 2),
             "accuracy": accuracy,
             "confidence": confidence,
-            "files_processed": len(pdf_paths),
+            "files_processed": file_count,
             "llm_model": "Mistral Large"
         }
         
-        create_excel(all_results, template_id, output_path, metadata)
+        # XLSX serialization is blocking: keep it off the event loop
+        await asyncio.to_thread(create_excel, all_results, template_id, output_path, metadata)
         
         # Save history
-        history = []
-        if HISTORY_FILE.exists():
-            with open(HISTORY_FILE, 'r') as f:
-                history = json.load(f)
-        
-        history.append({
+        session = {
             "session_id": session_id,
-            "created_at": datetime.now().isoformat(),
+            "created_at": now_iso,
             "template": template_id,
-            "files": [name for _, name in pdf_paths],
+            "files": pdf_names,
             "output_file": output_filename,
             "messages": [{
                 "role": "assistant",
-                "content": f"✅ **Extraction Complete!**\n\n• Files: {len(pdf_paths)}/{len(pdf_paths)} extracted\n• Time: {metadata['processing_time']}s\n• Accuracy: {accuracy}%\n• Confidence: {confidence}%\n\n💡 You can now download the Excel or ask questions!",
-                "timestamp": datetime.now().isoformat(),
+                "content": f"✅ **Extraction Complete!**\n\n• Files: {file_count}/{file_count} extracted\n• Time: {metadata['processing_time']}s\n• Accuracy: {accuracy}%\n• Confidence: {confidence}%\n\n💡 You can now download the Excel or ask questions!",
+                "timestamp": now_iso,
                 "excelFile": output_filename,
                 "summary": {
-                    "successful": len(pdf_paths),
-                    "files_processed": len(pdf_paths),
+                    "successful": file_count,
+                    "files_processed": file_count,
                     "processing_time": metadata['processing_time'],
                     "excel_file": output_filename,
-                    "pdf_names": [name for _, name in pdf_paths],
-                    "session_name": f"{pdf_paths[0][1][:30]}...",
+                    "pdf_names": pdf_names,
+                    "session_name": f"{pdf_names[0][:30]}...",
                     "accuracy": accuracy,
                     "confidence": confidence
                 },
                 "isResult": True
             }]
-        })
-        
-        with open(HISTORY_FILE, 'w') as f:
-            json.dump(history, f, indent=2)
+        }
+        await asyncio.to_thread(add_session, session)
         
         total_time = time.time() - start_time
         logger.info(f"🎉 Session {session_id}: Complete in {total_time:.2f}s (Acc: {accuracy}%, Conf: {confidence}%)")
         
-        return JSONResponse({
+        return ORJSONResponse({
             "success": True,
             "session_id": session_id,
             "summary": {
-                "successful": len(pdf_paths),
-                "files_processed": len(pdf_paths),
+                "successful": file_count,
+                "files_processed": file_count,
                 "processing_time": round(total_time, 2),
                 "excel_file": output_filename,
-                "pdf_names": [name for _, name in pdf_paths],
+                "pdf_names": pdf_names,
                 "accuracy": round(accuracy, 2),
                 "confidence": round(confidence, 2)
             },
-            "results": [{"filename": name, "status": "success"} for _, name in pdf_paths]
+            "results": [{"filename": name, "status": "success"} for name in pdf_names]
+                     + [{"filename": f.filename, "status": "skipped", "error": "Unsupported file type"} for f in skipped]
         })
     
     except Exception as e:
         logger.error(f"💥 Extraction failed: {e}", exc_info=True)
         raise HTTPException(500, str(e))
 
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Behind nginx: an `internal` location aliasing OUTPUT_DIR (e.g. /internal-outputs/).
+# When set, downloads are handed to nginx via X-Accel-Redirect and sent with sendfile.
+DOWNLOAD_ACCEL_PREFIX = os.getenv("DOWNLOAD_ACCEL_PREFIX", "").rstrip("/")
+
 @app.get("/api/download/{filename}")
-async def download(filename: str):
-    """Download Excel file"""
+async def download(filename: str, request: Request):
+    """Download Excel file (conditional GETs get a 304)"""
     path = OUTPUT_DIR / filename
-    if not path.exists():
+    try:
+        stat = path.stat()
+    except OSError:
         raise HTTPException(404, "File not found")
-    return FileResponse(path, filename=filename)
+    
+    etag = f'"{stat.st_size}-{int(stat.st_mtime)}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    if DOWNLOAD_ACCEL_PREFIX:
+        headers["X-Accel-Redirect"] = f"{DOWNLOAD_ACCEL_PREFIX}/{quote(filename)}"
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return Response(media_type=XLSX_MEDIA_TYPE, headers=headers)
+    
+    # Hand the stat result over so FileResponse doesn't stat the file again
+    return FileResponse(path, filename=filename, media_type=XLSX_MEDIA_TYPE,
+                        headers=headers, stat_result=stat)
 
 @app.post("/api/chat")
 async def chat(message: str = Form(...), session_id: str = Form(...), pdf_context: str = Form("")):
     """Chat with extracted data"""
     try:
-        if not HISTORY_FILE.exists():
-            return JSONResponse({"response": "No extraction history found."})
-        
-        with open(HISTORY_FILE, 'r') as f:
-            history = json.load(f)
+        await asyncio.to_thread(sync_sessions)
+        if not SESSIONS:
+            return ORJSONResponse({"response": "No extraction history found."})
         
-        session = next((s for s in history if s["session_id"] == session_id), None)
+        session = SESSIONS.get(session_id)
         if not session:
-            return JSONResponse({"response": "Session not found."})
+            return ORJSONResponse({"response": "Session not found."})
         
         excel_file = session.get("output_file")
         if not excel_file:
-            return JSONResponse({"response": "No Excel file found."})
+            return ORJSONResponse({"response": "No Excel file found."})
         
-        # Read Excel
+        # Read Excel (once per session; later questions hit the cache)
         excel_path = OUTPUT_DIR / excel_file
-        wb = openpyxl.load_workbook(excel_path)
-        
-        data_summary = {}
-        for sheet in wb.sheetnames[:5]:
-            ws = wb[sheet]
-            data_summary[sheet] = [[str(cell.value) for cell in row] for row in ws.iter_rows(max_row=10)]
+        data_summary = await asyncio.to_thread(workbook_summary_json, excel_path)
         
         # Query LLM
         prompt = f"""Based on this extracted financial data, answer the question clearly and concisely.
 
 DATA:
-{json.dumps(data_summary, indent=2)}
+{data_summary}
 
 QUESTION: {message}
 
 Provide a direct answer with specific numbers or facts from the data. Return as JSON: {{"answer": "your answer here"}}"""
 
-        response = await call_mistral_optimized(prompt, max_tokens=500)
+        response, _ = await call_mistral_optimized(prompt, max_tokens=500)
         answer = response.get("answer", str(response)) if isinstance(response, dict) else str(response)
         
-        return JSONResponse({"response": answer})
+        return ORJSONResponse({"response": answer})
     
     except Exception as e:
         logger.error(f"Chat error: {e}")
-        return JSONResponse({"response": "Error processing your question."})
+        return ORJSONResponse({"response": "Error processing your question."})
 
+# Plain `def` handlers: FastAPI runs them in its threadpool, so file I/O doesn't block the loop
 @app.get("/api/history")
-async def history():
+def history():
     """Get session history"""
-    if not HISTORY_FILE.exists():
-        return JSONResponse({"sessions": []})
+    # Re-serialize only when sessions were added since the last call
+    sessions = load_history()
+    if HISTORY_RESPONSE_CACHE["count"] != len(sessions):
+        body = orjson.dumps({"sessions": sessions})
+        HISTORY_RESPONSE_CACHE.update(count=len(sessions), body=body)
     
-    with open(HISTORY_FILE, 'r') as f:
-        data = json.load(f)
-    
-    return JSONResponse({"sessions": data})
+    return Response(content=HISTORY_RESPONSE_CACHE["body"], media_type="application/json")
 
 @app.get("/api/history/{session_id}")
-async def get_session(session_id: str):
+def get_session(session_id: str):
     """Get specific session"""
-    if not HISTORY_FILE.exists():
+    sync_sessions()
+    if not SESSIONS:
         raise HTTPException(404, "No history found")
     
-    with open(HISTORY_FILE, 'r') as f:
-        history = json.load(f)
-    
-    session = next((s for s in history if s["session_id"] == session_id), None)
+    session = SESSIONS.get(session_id)
     if not session:
         raise HTTPException(404, "Session not found")
     
-    return JSONResponse(session)
+    return ORJSONResponse(session)
 
 @app.get("/api/templates")
 async def templates():
     """Get available templates"""
-    return JSONResponse({
-        "templates": {
-            tid: {"name": t["name"], "sheets": t["sheets"]}
-            for tid, t in TEMPLATES.items()
-        }
-    })
+    return Response(content=TEMPLATES_RESPONSE_BODY, media_type="application/json")
 
 @app.get("/")
 async def root():
     return {"message": "Velocity.ai API v2.2 - OPTIMIZED", "status": "online"}
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Close HTTP client on shutdown"""
-    await http_client.aclose()
-
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # uvloop + httptools ship with uvicorn[standard]. Workers are separate processes,
+    # each with its own Mistral rate limiter, so keep WORKERS=1 on the free tier.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WORKERS", "1")),
+        loop="uvloop",
+        http="httptools",
+        log_level="info"
+    )
\ No newline at end of file